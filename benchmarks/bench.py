@@ -0,0 +1,162 @@
+"""Benchmark deepstash on synthetic trees.
+
+Builds trees locally (many tiny files, a few huge files, deep nesting, and a
+mix), then times deepstash_item, restore and safe_copytree on each of them.
+Every measurement runs in a fresh process so its peak RSS is its own, and
+ds's per-phase metrics are recorded alongside files/s and MB/s.
+
+    python benchmarks/bench.py --output results.json
+    python benchmarks/bench.py --scale 0.1 --compare results.json
+
+By default the stash root is a temporary directory next to the trees; on the
+same filesystem deepstash moves items with a rename, so pass --root on another
+drive to measure actual copying.
+"""
+import os
+import sys
+import json
+import shutil
+import tempfile
+import argparse
+import platform
+import multiprocessing
+from contextlib import redirect_stdout, redirect_stderr
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import ds  # noqa: E402
+
+SCENARIOS = ("tiny", "huge", "deep", "mixed")
+OPERATIONS = ("stash", "restore", "safe_copytree")
+
+BLOCK = os.urandom(1024 * 1024)
+
+def _write(path, size):
+    """Write size bytes of random-looking data by repeating one random block."""
+    with open(path, "wb") as f:
+        while size > 0:
+            n = min(size, len(BLOCK))
+            f.write(BLOCK[:n])
+            size -= n
+
+def build_tree(kind, path, scale=1.0):
+    """Create one synthetic tree at path. Returns (bytes, files)."""
+    os.makedirs(path)
+    files = []
+    if kind in ("tiny", "mixed"):
+        count = max(1, int(20000 * scale))
+        for i in range(count):
+            files.append((os.path.join(f"d{i % 100:03d}", f"f{i}.txt"), 1024))
+    if kind in ("huge", "mixed"):
+        for i in range(4):
+            files.append((f"huge{i}.bin", max(1, int(256 * 1024 * 1024 * scale))))
+    if kind in ("deep", "mixed"):
+        depth = max(1, int(200 * min(scale, 1.0)))
+        level = ""
+        for i in range(depth):
+            level = os.path.join(level, f"n{i}")
+            for j in range(max(1, int(10 * scale))):
+                files.append((os.path.join(level, f"f{j}.dat"), 16 * 1024))
+    total = 0
+    for rel, size in files:
+        full = os.path.join(path, rel)
+        os.makedirs(os.path.dirname(full), exist_ok=True)
+        _write(full, size)
+        total += size
+    return total, len(files)
+
+def _run(operation, src, dst, config):
+    """Run one operation with ds's metrics on (in a fresh worker process) and time it."""
+    ds.METRICS = ds.Metrics()
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull), redirect_stderr(devnull):
+        if operation == "stash":
+            ok = ds.deepstash_item(src, config)
+        elif operation == "restore":
+            ok = ds.restore(src + ".ds", config)
+        else:
+            ok = not ds.safe_copytree(src, dst)
+    data = ds.METRICS.as_dict()
+    data["ok"] = bool(ok)
+    return data
+
+def measure(operation, src, dst, config):
+    """Run _run in a process of its own so peak RSS isn't inherited from earlier runs."""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(_run, operation, src, dst, config).result()
+
+def run_benchmarks(scenarios, work_dir, root, scale):
+    """Build each scenario's tree and measure every operation on it."""
+    results = []
+    config = {"root": root}
+    for scenario in scenarios:
+        src = os.path.join(work_dir, scenario)
+        print(f"🏗️ Building '{scenario}' tree...")
+        total, files = build_tree(scenario, src, scale)
+        for operation in OPERATIONS:
+            dst = os.path.join(work_dir, scenario + "-copy")
+            data = measure(operation, src, dst, config)
+            seconds = data["seconds"] or 1e-9
+            result = {"scenario": scenario, "operation": operation, "files": files, "bytes": total,
+                      "seconds": round(seconds, 6), "files_per_s": round(files / seconds, 1),
+                      "mb_per_s": round(total / seconds / 1024 / 1024, 2),
+                      "peak_rss_mb": round((data["peak_rss_bytes"] or 0) / 1024 / 1024, 1),
+                      "phases": data["phases"], "counters": data["counters"], "ok": data["ok"]}
+            results.append(result)
+            print(f"  {operation:<14} {result['seconds']:8.3f}s {result['files_per_s']:>10} files/s "
+                  f"{result['mb_per_s']:>9} MB/s {result['peak_rss_mb']:>7} MB RSS" + ("" if data["ok"] else "  ❌"))
+            if operation == "safe_copytree":
+                shutil.rmtree(dst, ignore_errors=True)
+        shutil.rmtree(src, ignore_errors=True)
+    return results
+
+def compare(results, baseline_path, same_fs):
+    """Print each measurement's speed relative to a saved run."""
+    with open(baseline_path, "r") as f:
+        saved = json.load(f)
+    baseline = {(r["scenario"], r["operation"]): r for r in saved["results"]}
+    print(f"\n📊 Compared with {baseline_path}:")
+    if saved.get("same_filesystem") != same_fs:
+        print("⚠️ One run moved items with renames and the other copied them; the numbers aren't comparable.")
+    for result in results:
+        before = baseline.get((result["scenario"], result["operation"]))
+        if before is None or not before["seconds"]:
+            continue
+        ratio = before["seconds"] / result["seconds"]
+        marker = "🟢" if ratio >= 1.05 else "🔴" if ratio <= 0.95 else "⚪"
+        print(f"  {marker} {result['scenario']:<6} {result['operation']:<14} {ratio:5.2f}x "
+              f"({before['seconds']:.3f}s → {result['seconds']:.3f}s)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark deepstash on synthetic trees.")
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="Multiply file counts and sizes (default 1.0: 20k tiny files, 4x256 MiB huge files)")
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS,
+                        help="Run only this scenario (repeatable; default: all)")
+    parser.add_argument("--root", help="Stash root to use (default: a temporary directory)")
+    parser.add_argument("--work-dir", help="Where to build the trees (default: a temporary directory)")
+    parser.add_argument("--output", help="Save the results as JSON")
+    parser.add_argument("--compare", help="Compare against results saved earlier with --output")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="ds-bench-", dir=args.work_dir)
+    root = args.root or tempfile.mkdtemp(prefix="ds-bench-root-")
+    same_fs = ds.same_filesystem(work_dir, root)
+    if same_fs:
+        print("ℹ️ Trees and stash root share a filesystem, so stash and restore measure renames. "
+              "Use --root on another drive to measure copying.")
+    try:
+        results = run_benchmarks(args.scenario or SCENARIOS, work_dir, root, args.scale)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        if not args.root:
+            shutil.rmtree(root, ignore_errors=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"python": platform.python_version(), "platform": platform.platform(),
+                       "scale": args.scale, "same_filesystem": same_fs, "results": results}, f, indent=2)
+        print(f"💾 Saved results to {args.output}")
+    if args.compare:
+        compare(results, args.compare, same_fs)
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,162 @@
 import os
 import sys
 import json
+import errno
+import stat
+import hashlib
+import gzip
+import functools
+import uuid
 import shutil
+import sqlite3
+import zipfile
+import mmap
+import atexit
+from fnmatch import fnmatch
+from contextlib import closing, contextmanager, redirect_stdout, ExitStack
 from datetime import datetime
 import time
+import threading
+from collections import deque
+try:
+    import lzma
+except ImportError:  # Python built without liblzma
+    lzma = None
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
 try:
     from tqdm import tqdm
 except ImportError:
     print("⚠️ tqdm not installed. Progress bars will be disabled.")
-    def tqdm(x, *a, **kw): return x
+    class tqdm:
+        """Silent stand-in for tqdm that supports both iteration and manual updates."""
+        def __init__(self, iterable=None, *a, **kw):
+            self.iterable = iterable
+        def __iter__(self):
+            return iter(self.iterable or [])
+        def __enter__(self):
+            return self
+        def __exit__(self, *exc):
+            return False
+        def update(self, n=1):
+            pass
+        def close(self):
+            pass
 
 VERBOSE = False
+JOBS = None  # Number of copy workers; None picks a default from the CPU count
+SPLIT_LARGE = False  # Give large files their own workers so they don't starve small ones
+LARGE_FILE_SIZE = 64 * 1024 * 1024  # Files at or above this size count as "large"
+CHUNK_SIZE = 1024 * 1024  # 1 MiB per chunk for userspace copies and progress updates
+KERNEL_CHUNK_SIZE = 8 * 1024 * 1024  # Bytes per copy_file_range/sendfile call
+FICLONE = 0x40049409  # Linux ioctl that reflinks one file to another (btrfs, XFS, ...)
+DEDUP = False  # Store file contents once as content-addressed blobs
+KEEP = False  # Restore without deleting the stashed copy, so the next stash is incremental
+CHECKSUM = False  # Hash files while they are copied into the stash and verify them on restore
+METRICS = None  # A Metrics collector while --stats or --metrics-json is in effect
+META_DIR = ".deepstash"  # Bookkeeping directory kept inside the stash root
+CATALOG_NAME = "catalog.db"
+GC_GRACE_SECONDS = 3600  # --gc leaves blobs this recent alone in case a stash is still writing its manifest
+SCAN_BATCH = 256  # Ghosts parsed and checked per task by 'ds --scan'
+COMPRESS = None  # Codec name chosen with --compress
+PACK = False  # Stash directories as a few zip segments instead of one file per file
+PACK_SUFFIX = ".dspack"
+PACK_INDEX_NAME = "pack.json"  # Lists a pack's segments; each segment carries its own zip index
+PACK_SEGMENT_SIZE = 4 * 1024 ** 3  # Start a new segment once this many bytes are in the current one
+COMPRESSED_SUFFIX = ".dsz"  # Added to the stashed name of every compressed file
+PARTIAL_SUFFIX = ".ds-partial"  # A file being restored, until it is complete and verified
+COMPRESS_BLOCK_SIZE = 4 * 1024 * 1024  # Input bytes per independently compressed block
+# Formats that are compressed already; recompressing them only burns CPU
+ALREADY_COMPRESSED = {
+    ".gz", ".tgz", ".xz", ".txz", ".bz2", ".zst", ".lz4", ".zip", ".7z", ".rar", ".jar", ".whl",
+    ".jpg", ".jpeg", ".png", ".gif", ".webp", ".heic", ".avif",
+    ".mp3", ".aac", ".ogg", ".flac", ".m4a", ".mp4", ".m4v", ".mkv", ".mov", ".avi", ".webm",
+    ".docx", ".xlsx", ".pptx", ".odt", ".epub", ".apk", ".dmg", ".iso",
+}
+
+def peak_rss():
+    """Peak resident set size of this process in bytes, or None where it can't be read."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+class Metrics:
+    """Time spent per phase (walk, mkdir, copy, delete, ghost, ...) and counters for one run.
+
+    Safe to update from copy workers. Phase times are summed over every item,
+    so in a batch they can add up to more than the wall-clock time.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.phases = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def add_time(self, name, seconds):
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def as_dict(self):
+        return {"seconds": round(time.monotonic() - self.started, 6),
+                "phases": {name: round(seconds, 6) for name, seconds in self.phases.items()},
+                "counters": dict(self.counters),
+                "peak_rss_bytes": peak_rss()}
+
+    def report(self, out=sys.stderr):
+        """Print a short human-readable summary."""
+        data = self.as_dict()
+        print(f"⏱️ Finished in {data['seconds']:.2f}s", file=out)
+        for name, seconds in sorted(data["phases"].items(), key=lambda item: -item[1]):
+            print(f"  {name:<8} {seconds:9.3f}s", file=out)
+        counters = data["counters"]
+        for name in sorted(counters):
+            value = format_size(counters[name]) if name.startswith("bytes") else counters[name]
+            print(f"  {name:<16} {value}", file=out)
+        if counters.get("bytes_copied") and data["phases"].get("copy"):
+            print(f"  {'copy rate':<16} {format_size(counters['bytes_copied'] / data['phases']['copy'])}/s", file=out)
+        if data["peak_rss_bytes"]:
+            print(f"  {'peak RSS':<16} {format_size(data['peak_rss_bytes'])}", file=out)
+
+@contextmanager
+def phase(name):
+    """Add the time spent in the block to a phase of the run's metrics, if they are being collected."""
+    if METRICS is None:
+        yield
+        return
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        METRICS.add_time(name, time.monotonic() - start)
+
+def count(name, n=1):
+    """Bump a counter in the run's metrics, if they are being collected."""
+    if METRICS is not None:
+        METRICS.count(name, n)
+
+def timed_walk(walk):
+    """Pass through an os.walk generator, counting the time spent inside it as the 'walk' phase."""
+    walk = iter(walk)
+    while True:
+        with phase("walk"):
+            step = next(walk, None)
+        if step is None:
+            return
+        yield step
 
 def init():
     """Initialize DeepStash by setting the root directory for stashed files."""
@@ -38,98 +184,1934 @@ def load_config():
     with open(config_path, "r") as f:
         return json.load(f)
 
+_reserved_paths = set()
+_reserved_lock = threading.Lock()
+
 def get_unique_path(path):
-    """Generate a unique file or directory path by appending an index if needed."""
-    if not os.path.exists(path):
-        return path
-    base, ext = os.path.splitext(path)
-    i = 1
-    # Increment index until a non-existing path is found
+    """Generate a unique file or directory path by appending an index if needed.
+
+    Paths handed out are remembered, so concurrent stashes in a batch never pick
+    the same destination before either of them has created it.
+    """
+    with _reserved_lock:
+        new_path = path
+        base, ext = os.path.splitext(path)
+        i = 1
+        # Increment index until a non-existing path is found
+        while os.path.exists(new_path) or new_path in _reserved_paths:
+            new_path = f"{base}_{i}{ext}"
+            i += 1
+        _reserved_paths.add(new_path)
+        return new_path
+
+def meta_path(config, *parts):
+    """Return a path inside the stash root's bookkeeping directory, creating that directory."""
+    meta_dir = os.path.join(config["root"], META_DIR)
+    os.makedirs(meta_dir, exist_ok=True)
+    return os.path.join(meta_dir, *parts)
+
+def stash_tiers(config):
+    """Every stash root as a config of its own, fastest tier first.
+
+    With a "tiers" list, each tier's settings (root, jobs, compress, ...) are
+    laid over the top-level ones; a plain single-"root" config is its only tier.
+    """
+    if "tiers" not in config:
+        return [config]
+    base = {key: value for key, value in config.items() if key not in ("tiers", "root")}
+    tiers = []
+    for tier in config["tiers"]:
+        tier = dict(base, **tier)
+        tier.setdefault("name", tier["root"])
+        tiers.append(tier)
+    return tiers
+
+def each_tier(config):
+    """Yield each reachable tier's config, announcing it when there is more than one."""
+    tiers = stash_tiers(config)
+    for tier in tiers:
+        if len(tiers) > 1:
+            if not os.path.isdir(tier["root"]):
+                print(f"\n⚠️ Tier '{tier['name']}' at {tier['root']} is not reachable. Skipping.")
+                continue
+            print(f"\n🗄️ Tier '{tier['name']}' ({tier['root']})")
+        yield tier
+
+def parse_size(value):
+    """Turn a size like 500G, 1.5T or 4096 into bytes."""
+    if isinstance(value, (int, float)):
+        return int(value)
+    value = value.strip().upper().rstrip("B")
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(float(value))
+
+def tier_for_path(config, path):
+    """The tier whose root holds path (the deepest match), or the first tier if none does."""
+    tiers = stash_tiers(config)
+    path = os.path.abspath(path)
+    matches = [tier for tier in tiers
+               if path == os.path.abspath(tier["root"]) or path.startswith(os.path.abspath(tier["root"]) + os.sep)]
+    return max(matches, key=lambda tier: len(tier["root"])) if matches else tiers[0]
+
+def tier_usage(tier):
+    """Bytes the catalog says a tier holds."""
+    with closing(open_catalog(tier)) as conn:
+        catalog_fill_sizes(conn)
+        return conn.execute("SELECT COALESCE(SUM(size), 0) FROM items").fetchone()[0]
+
+def pick_tier(tiers, name, size, pending=None):
+    """The first of tiers whose placement rules accept an item and that has room for it, or None.
+
+    Rules are optional per tier: min_size and max_size bound the item's size,
+    patterns lists globs its name must match, and capacity caps what the tier
+    holds. pending maps roots to bytes already promised to items in flight.
+    """
+    for tier in tiers:
+        if size < parse_size(tier.get("min_size", 0)):
+            continue
+        if "max_size" in tier and size > parse_size(tier["max_size"]):
+            continue
+        if tier.get("patterns") and not any(fnmatch(name, pattern) for pattern in tier["patterns"]):
+            continue
+        if not os.path.isdir(tier["root"]):
+            continue
+        used = tier_usage(tier) + (pending or {}).get(tier["root"], 0)
+        if "capacity" in tier and used + size > parse_size(tier["capacity"]):
+            continue
+        if shutil.disk_usage(tier["root"]).free < size:
+            continue
+        return tier
+    return None
+
+def place_item(target, config, size=None, pending=None):
+    """Choose the tier a new stash of target goes to; returns its config, or None if no tier will take it.
+
+    An interrupted stash, or a copy kept by 'restore --keep', ties the item to
+    the tier that already holds it.
+    """
+    tiers = stash_tiers(config)
+    if len(tiers) == 1:
+        return tiers[0]
+    original = os.path.abspath(target)
+    for tier in tiers:
+        if not os.path.isdir(tier["root"]):
+            continue
+        journal = find_journal(tier, "stash", original)
+        if journal is not None:
+            journal.close()
+            return tier
+        if find_kept(tier, original) is not None:
+            return tier
+    if not os.path.lexists(target):
+        return tiers[0]  # Reported as missing by the caller
+    if size is None:
+        # Walking the item is as costly as stashing it; only do so for size rules
+        sized = any(key in tier for tier in tiers for key in ("min_size", "max_size", "capacity"))
+        size = item_size(target)[0] if sized else 0
+    return pick_tier(tiers, os.path.basename(original), size, pending)
+
+def convert_legacy_ghost(ghost):
+    """Rename the keys of an old-format ghost in place. Returns True if anything changed."""
+    if "deep_stash_path" in ghost and "original_path" in ghost and "deep" not in ghost and "original" not in ghost:
+        ghost["deep"] = ghost.get("deep_stash_path")
+        ghost["original"] = ghost.get("original_path")
+        if "type" in ghost and ghost["type"] == "folder":
+            ghost["type"] = "dir"
+        elif "type" in ghost and ghost["type"] == "file":
+            ghost["type"] = "file"
+        return True
+    return False
+
+def read_ghost(ghost_file):
+    """Load a .ds file quietly, returning None if it is unreadable or has no 'deep' path."""
+    try:
+        with open(ghost_file, "r") as f:
+            ghost = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(ghost, dict):
+        return None
+    convert_legacy_ghost(ghost)
+    return ghost if "deep" in ghost else None
+
+def format_size(num_bytes):
+    """Render a byte count the way tqdm does, e.g. 1.5G."""
+    for unit in ("B", "K", "M", "G", "T"):
+        if abs(num_bytes) < 1024 or unit == "T":
+            return f"{num_bytes:.0f}{unit}" if unit == "B" else f"{num_bytes:.1f}{unit}"
+        num_bytes /= 1024
+
+def open_catalog(config):
+    """Open (and create if needed) the SQLite catalog of everything in the stash."""
+    conn = sqlite3.connect(meta_path(config, CATALOG_NAME), timeout=30)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS items (
+            deep TEXT PRIMARY KEY,
+            original TEXT,
+            type TEXT,
+            size INTEGER,
+            files INTEGER,
+            timestamp TEXT,
+            ghost TEXT,
+            state TEXT
+        )""")
+    # Catalogs created before 'state' existed get the column added in place
+    if "state" not in [row[1] for row in conn.execute("PRAGMA table_info(items)")]:
+        conn.execute("ALTER TABLE items ADD COLUMN state TEXT")
+    conn.execute("CREATE INDEX IF NOT EXISTS items_original ON items (original)")
+    return conn
+
+def catalog_record(config, ghost, ghost_path, size, files):
+    """Add or replace the catalog entry for a freshly stashed item."""
+    try:
+        with closing(open_catalog(config)) as conn, conn:
+            conn.execute("INSERT OR REPLACE INTO items (deep, original, type, size, files, timestamp, ghost)"
+                         " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                         (ghost["deep"], ghost["original"], ghost["type"], size, files,
+                          ghost.get("timestamp"), ghost_path))
+    except sqlite3.Error as e:
+        print(f"⚠️ Could not update the stash catalog: {e}. Run 'ds --reindex' to rebuild it.")
+
+def catalog_keep(config, deep):
+    """Mark an item as restored but still kept in the stash for an incremental re-stash."""
+    try:
+        with closing(open_catalog(config)) as conn, conn:
+            conn.execute("UPDATE items SET state = 'kept', ghost = NULL WHERE deep = ?", (deep,))
+    except sqlite3.Error as e:
+        print(f"⚠️ Could not update the stash catalog: {e}. Run 'ds --reindex' to rebuild it.")
+
+def catalog_forget(config, deep):
+    """Drop the catalog entry for an item that has left the stash."""
+    try:
+        with closing(open_catalog(config)) as conn, conn:
+            conn.execute("DELETE FROM items WHERE deep = ?", (deep,))
+    except sqlite3.Error as e:
+        print(f"⚠️ Could not update the stash catalog: {e}. Run 'ds --reindex' to rebuild it.")
+
+def catalog_fill_sizes(conn):
+    """Measure the items whose size was left blank when a rename stashed them, and store it."""
+    missing = conn.execute("SELECT deep FROM items WHERE size IS NULL").fetchall()
+    for (deep,) in missing:
+        try:
+            size, files = item_size(deep)
+        except OSError:
+            continue
+        conn.execute("UPDATE items SET size = ?, files = ? WHERE deep = ?", (size, files, deep))
+    if missing:
+        conn.commit()
+
+def item_size(path):
+    """Return (total bytes, file count) for a stashed file or directory."""
+    if not os.path.isdir(path):
+        return os.path.getsize(path), 1
+    _, files = scan_tree(path)
+    return sum(size for _, size in files), len(files)
+
+def print_catalog_rows(rows):
+    """Print catalog rows as one line per stashed item."""
+    for deep, original, kind, size, files, timestamp, state in rows:
+        icon = "📁" if kind == "dir" else "📄"
+        count = f" ({files if files is not None else '?'} files)" if kind == "dir" else ""
+        kept = " [kept after restore]" if state == "kept" else ""
+        shown = format_size(size) if size is not None else "?"
+        print(f"{icon} {shown:>7}  {original or '(no ghost)'} → {deep}{count}{kept}  {timestamp or ''}")
+
+def list_catalog(config, pattern=None):
+    """Print catalog entries, optionally only those whose original or stash path matches a glob."""
+    query = "SELECT deep, original, type, size, files, timestamp, state FROM items"
+    params = ()
+    if pattern is not None:
+        # Bare names like '*.iso' match anywhere in the path, as a shell user would expect
+        if "/" not in pattern and not pattern.startswith("*"):
+            pattern = "*/" + pattern
+        query += " WHERE original GLOB ? OR deep GLOB ?"
+        params = (pattern, pattern)
+    with closing(open_catalog(config)) as conn:
+        rows = conn.execute(query + " ORDER BY original", params).fetchall()
+    if not rows:
+        print("📭 Nothing found in the stash catalog." if pattern else "📭 The stash catalog is empty.")
+        return
+    print_catalog_rows(rows)
+
+def catalog_usage(config):
+    """Print how much the stash holds, overall and for the largest items."""
+    with closing(open_catalog(config)) as conn:
+        catalog_fill_sizes(conn)
+        count, total, files = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(files), 0) FROM items").fetchone()
+        largest = conn.execute(
+            "SELECT deep, original, type, size, files, timestamp, state FROM items"
+            " ORDER BY size DESC LIMIT 10").fetchall()
+    print(f"📦 {count} stashed items, {files} files, {format_size(total)} in {config['root']}")
+    if largest:
+        print("\nLargest items:")
+        print_catalog_rows(largest)
+
+def reindex_catalog(config, search_dirs, skip=()):
+    """Rebuild the catalog from what is in the stash root and the ghosts found under search_dirs.
+
+    skip lists more directories not to search, such as other stash roots.
+    """
+    root = os.path.abspath(config["root"])
+    rows = {}
+    print(f"🔎 Indexing stash contents in {root}...")
+    for entry in os.scandir(root):
+        if entry.name == META_DIR:
+            continue
+        size, files = item_size(entry.path)
+        rows[entry.path] = [entry.path, None, "dir" if entry.is_dir() else "file", size, files, None, None, None]
+    manifests_dir = os.path.join(root, META_DIR, "manifests")
+    if os.path.isdir(manifests_dir):
+        for entry in os.scandir(manifests_dir):
+            manifest = read_manifest(entry.path)
+            if manifest is not None:
+                size = sum(f["size"] for f in manifest["files"])
+                rows[entry.path] = [entry.path, None, manifest["type"], size, len(manifest["files"]), None, None, None]
+    kept_dir = os.path.join(root, META_DIR, "kept")
+    if os.path.isdir(kept_dir):
+        for entry in os.scandir(kept_dir):
+            kept = read_manifest(entry.path)
+            if kept is not None and kept["deep"] in rows:
+                rows[kept["deep"]][1] = kept["original"]
+                rows[kept["deep"]][7] = "kept"
+    print(f"🔎 Looking for ghosts under {', '.join(search_dirs)}...")
+    for ghost_path in walk_ghosts(search_dirs, skip=(root,) + tuple(skip)):
+        ghost = read_ghost(ghost_path)
+        if ghost is None or ghost["deep"] not in rows:
+            continue
+        row = rows[ghost["deep"]]
+        row[1] = ghost.get("original", ghost_path[:-3])
+        row[5] = ghost.get("timestamp")
+        row[6] = ghost_path
+    with closing(open_catalog(config)) as conn, conn:
+        conn.execute("DELETE FROM items")
+        conn.executemany("INSERT INTO items (deep, original, type, size, files, timestamp, ghost, state)"
+                         " VALUES (?, ?, ?, ?, ?, ?, ?, ?)", list(rows.values()))
+    with_ghosts = sum(1 for row in rows.values() if row[6])
+    print(f"✅ Reindexed {len(rows)} stashed items ({with_ghosts} with ghosts).")
+
+def _scan_dir(path):
+    """List one directory for walk_ghosts: returns (subdirectories, ghost paths), both empty if unreadable."""
+    subdirs = []
+    ghosts = []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    # d_type from the directory listing; no stat per entry
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                    elif entry.name.endswith(".ds"):
+                        ghosts.append(entry.path)
+                except OSError:
+                    pass
+    except OSError:
+        pass
+    return subdirs, ghosts
+
+def walk_ghosts(search_dirs, skip=(), jobs=None):
+    """Yield the absolute path of every .ds file under search_dirs, listing directories in parallel.
+
+    Symlinked directories are not followed, and directories in skip (such as
+    the stash root) are not entered.
+    """
+    skip = {os.path.abspath(path) for path in skip}
+    with ThreadPoolExecutor(max_workers=jobs or JOBS or default_jobs()) as executor:
+        pending = {executor.submit(_scan_dir, os.path.abspath(path)) for path in search_dirs
+                   if os.path.abspath(path) not in skip}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                subdirs, ghosts = future.result()
+                pending.update(executor.submit(_scan_dir, d) for d in subdirs if d not in skip)
+                yield from ghosts
+
+def _check_ghosts(ghost_paths):
+    """Parse a batch of ghosts and stat each one's stashed item once.
+
+    Returns (ghost path, ghost or None, problem or None, what was found) tuples.
+    """
+    results = []
+    for ghost_path in ghost_paths:
+        ghost = read_ghost(ghost_path)
+        if ghost is None:
+            results.append((ghost_path, None, "unreadable", None))
+            continue
+        try:
+            st = os.stat(ghost["deep"])
+        except FileNotFoundError:
+            results.append((ghost_path, ghost, "dangling", None))
+            continue
+        except OSError as e:
+            results.append((ghost_path, ghost, "inaccessible", str(e)))
+            continue
+        found = "dir" if stat.S_ISDIR(st.st_mode) else "file"
+        # A deduplicated item, file or folder, is stored as a manifest file
+        expected = "file" if ghost.get("store") == "cas" else ghost.get("type")
+        results.append((ghost_path, ghost, "type mismatch" if found != expected else None, found))
+    return results
+
+def scan_ghosts(config, search_dirs, as_json=False):
+    """Find every ghost under search_dirs and check it against the stash.
+
+    Reports ghosts whose stashed item is missing (dangling) or of the wrong
+    type, unreadable ghosts, and orphans: items in the stash root that no ghost
+    found points to. Returns True if nothing is wrong.
+    """
+    started = time.monotonic()
+    roots = [os.path.abspath(tier["root"]) for tier in stash_tiers(config)]
+    problems = {"dangling": [], "type mismatch": [], "unreadable": [], "inaccessible": []}
+    referenced = set()
+    ghosts = 0
+    if not as_json:
+        print(f"🔎 Scanning {', '.join(search_dirs)} for ghosts...")
+    with ThreadPoolExecutor(max_workers=JOBS or default_jobs()) as executor:
+        futures = []
+        batch = []
+        for ghost_path in walk_ghosts(search_dirs, skip=roots):
+            batch.append(ghost_path)
+            if len(batch) == SCAN_BATCH:
+                futures.append(executor.submit(_check_ghosts, batch))
+                batch = []
+        if batch:
+            futures.append(executor.submit(_check_ghosts, batch))
+        for future in futures:
+            for ghost_path, ghost, problem, found in future.result():
+                ghosts += 1
+                if ghost is not None:
+                    referenced.add(os.path.abspath(ghost["deep"]))
+                if problem is None:
+                    continue
+                report = {"ghost": ghost_path}
+                if ghost is not None:
+                    report.update(deep=ghost["deep"], type=ghost.get("type"))
+                if problem == "type mismatch":
+                    report["found"] = found
+                elif problem == "inaccessible":
+                    report["error"] = found
+                problems[problem].append(report)
+
+    # Anything in a stash root no ghost points at, except copies deliberately kept by 'restore --keep'
+    kept = set()
+    candidates = []
+    for root in roots:
+        kept_dir = os.path.join(root, META_DIR, "kept")
+        if os.path.isdir(kept_dir):
+            kept.update(os.path.join(root, entry.name[:-len(".json")]) for entry in os.scandir(kept_dir))
+        if os.path.isdir(root):
+            candidates += [entry.path for entry in os.scandir(root) if entry.name != META_DIR]
+        manifests_dir = os.path.join(root, META_DIR, "manifests")
+        if os.path.isdir(manifests_dir):
+            candidates += [entry.path for entry in os.scandir(manifests_dir) if entry.name.endswith(".json")]
+    orphans = sorted(path for path in candidates if path not in referenced and path not in kept)
+
+    elapsed = time.monotonic() - started
+    if as_json:
+        json.dump({"scanned": [os.path.abspath(d) for d in search_dirs], "roots": roots, "ghosts": ghosts,
+                   "dangling": problems["dangling"], "type_mismatches": problems["type mismatch"],
+                   "unreadable": problems["unreadable"], "inaccessible": problems["inaccessible"],
+                   "orphans": orphans, "seconds": round(elapsed, 3)}, sys.stdout, indent=2)
+        print()
+    else:
+        print(f"🔎 Checked {ghosts} ghosts in {elapsed:.1f}s.")
+        for report in problems["dangling"]:
+            print(f"👻 Dangling: {report['ghost']} → {report['deep']} (missing)")
+        for report in problems["type mismatch"]:
+            print(f"⚠️ Type mismatch: {report['ghost']} says {report['type']}, but {report['deep']} is a {report['found']}")
+        for report in problems["unreadable"]:
+            print(f"❌ Unreadable: {report['ghost']}")
+        for report in problems["inaccessible"]:
+            print(f"🚫 Inaccessible: {report['ghost']} → {report['deep']}: {report['error']}")
+        for path in orphans:
+            print(f"🧩 Orphaned: {path} (no ghost found)")
+        if not orphans and not any(problems.values()):
+            print("✅ Every ghost checks out, and every stashed item has a ghost.")
+        elif orphans:
+            print("ℹ️ Orphans only count ghosts under the scanned directories.")
+    return not orphans and not any(problems.values())
+
+class Journal:
+    """Append-only log of the files a stash or restore has finished, so it can resume after a crash.
+
+    The first line describes the operation. Each later line records one finished
+    file (relative path, size and mtime of the source, the size of the copy, and
+    its checksum if one was taken), or the point at which all of the data was in
+    place and only cleanup was left.
+    """
+
+    def __init__(self, path, header, done=None, copied=None, digests=None, stored=None):
+        self.path = path
+        self.header = header
+        self.done = done or {}
+        self.copied = copied
+        self.digests = digests or {}
+        self.stored = stored or {}
+        self._lock = threading.Lock()
+        self._file = open(path, "a")
+        self._last_sync = time.monotonic()
+
+    @classmethod
+    def start(cls, config, op, target, dest, **settings):
+        """Create a journal for a new operation on target ('stash' or 'restore')."""
+        os.makedirs(meta_path(config, "journal"), exist_ok=True)
+        path = meta_path(config, "journal", f"{op}-{uuid.uuid4().hex[:12]}.jsonl")
+        header = {"op": op, "target": target, "dest": dest, "started": datetime.now().isoformat()}
+        header.update(settings)
+        with open(path, "w") as f:
+            f.write(json.dumps(header) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        return cls(path, header)
+
+    @classmethod
+    def load(cls, path):
+        """Read a journal back, ignoring a last line that was cut short by the crash."""
+        with open(path, "r") as f:
+            lines = f.read().splitlines()
+        header = json.loads(lines[0])
+        done = {}
+        digests = {}
+        stored = {}
+        copied = None
+        for line in lines[1:]:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if "copied" in entry:
+                copied = entry["copied"]
+            else:
+                done[entry["path"]] = (entry["size"], entry["mtime"])
+                if "sha256" in entry:
+                    digests[entry["path"]] = entry["sha256"]
+                if "stored" in entry:
+                    stored[entry["path"]] = entry["stored"]
+        return cls(path, header, done, copied, digests, stored)
+
+    def is_done(self, rel, size, mtime, dst=None):
+        """Whether rel was already copied and its source hasn't changed since.
+
+        With dst, the copy there (or its compressed form) must also still have
+        the size recorded when it was made, so a copy cut short by a crash is
+        made again.
+        """
+        if self.done.get(rel) != (size, mtime):
+            return False
+        if dst is None:
+            return True
+        for path in (dst, dst + COMPRESSED_SUFFIX):
+            try:
+                if os.stat(path).st_size == self.stored.get(rel):
+                    return True
+            except OSError:
+                pass
+        return False
+
+    def record(self, rel, size, mtime, digest=None, stored=None):
+        entry = {"path": rel, "size": size, "mtime": mtime}
+        if digest is not None:
+            entry["sha256"] = digest
+        if stored is not None:
+            entry["stored"] = stored
+        self._write(entry)
+
+    def mark_copied(self, dest):
+        """Note that every byte is in place at dest; only removing the source is left."""
+        self.copied = dest
+        self._write({"copied": dest}, sync=True)
+
+    def _write(self, entry, sync=False):
+        with self._lock:
+            self._file.write(json.dumps(entry) + "\n")
+            self._file.flush()
+            # fsync at most once a second so journaling doesn't throttle small-file copies
+            now = time.monotonic()
+            if sync or now - self._last_sync >= 1:
+                os.fsync(self._file.fileno())
+                self._last_sync = now
+
+    def close(self):
+        self._file.close()
+
+    def finish(self):
+        """Delete the journal once the operation has completed."""
+        self.close()
+        os.remove(self.path)
+
+def pending_journals(config):
+    """Journals of stashes and restores that never finished, oldest first."""
+    journal_dir = os.path.join(config["root"], META_DIR, "journal")
+    if not os.path.isdir(journal_dir):
+        return []
+    journals = []
+    for entry in sorted(os.scandir(journal_dir), key=lambda e: e.stat().st_mtime):
+        if not entry.name.endswith(".jsonl"):
+            continue
+        try:
+            journals.append(Journal.load(entry.path))
+        except (OSError, ValueError, IndexError):
+            print(f"⚠️ Ignoring unreadable journal '{entry.path}'.")
+    return journals
+
+def find_journal(config, op, target):
+    """The pending journal for an interrupted op on target, if there is one."""
+    found = None
+    for journal in pending_journals(config):
+        if found is None and journal.header["op"] == op and journal.header["target"] == target:
+            found = journal
+        else:
+            journal.close()
+    return found
+
+def _fsync(path):
+    """fsync one file, or one directory's entries."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def sync_to_disk(paths, pool=None):
+    """Flush files and whole trees to stable storage, along with the directories listing them.
+
+    Runs before a journal marks the data as copied, because the source is
+    deleted right after; otherwise a power loss could take both copies.
+    """
+    files = []
+    dirs = set()
+    with phase("sync"):
+        for path in paths:
+            dirs.add(os.path.dirname(os.path.abspath(path)))
+            if os.path.islink(path):
+                continue
+            if os.path.isdir(path):
+                for root, _, names in os.walk(path):
+                    dirs.add(root)
+                    files += [p for p in (os.path.join(root, name) for name in names) if not os.path.islink(p)]
+            elif os.path.isfile(path):
+                files.append(path)
+        if pool is not None:
+            for _ in pool.run([(0, _fsync, (path,)) for path in files]):
+                pass
+        else:
+            for path in files:
+                _fsync(path)
+        for path in sorted(dirs):
+            _fsync(path)
+
+def same_filesystem(path, other):
+    """Return True if both paths live on the same device, so a rename can stand in for a copy."""
+    try:
+        return os.lstat(path).st_dev == os.stat(other).st_dev
+    except OSError:
+        return False
+
+def rename_item(src, dst):
+    """Move src to dst with a single rename.
+
+    Returns False if the rename crossed filesystems after all (EXDEV), in which
+    case nothing has moved and the caller should fall back to copying.
+    """
+    try:
+        with phase("rename"):
+            if os.path.isdir(src):
+                os.rename(src, dst)
+            else:
+                os.replace(src, dst)
+    except OSError as e:
+        if e.errno == errno.EXDEV:
+            return False
+        raise
+    count("renames")
+    return True
+
+def _clone_file(fsrc, fdst):
+    """Try to reflink fsrc into fdst so both share the same blocks. Returns True on success."""
+    if fcntl is None or not sys.platform.startswith("linux"):
+        return False
+    try:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+    except OSError:
+        return False
+    return True
+
+def _copy_kernel(fsrc, fdst, progress):
+    """Copy the rest of fsrc into fdst inside the kernel with copy_file_range, then sendfile.
+
+    Both calls advance the file offsets, so if neither is usable (or one gives up
+    part way through) the caller can carry on from where this stopped. A call
+    returning 0 only counts as the end if the source offset has reached the
+    source's size; some FUSE and NFS setups return 0 early.
+    Returns True if the copy reached the end of the source.
+    """
+    infd, outfd = fsrc.fileno(), fdst.fileno()
+    for method in ("copy_file_range", "sendfile"):
+        call = getattr(os, method, None)
+        if call is None or (method == "sendfile" and not sys.platform.startswith("linux")):
+            continue
+        try:
+            while True:
+                if method == "copy_file_range":
+                    sent = call(infd, outfd, KERNEL_CHUNK_SIZE)
+                else:
+                    sent = call(outfd, infd, None, KERNEL_CHUNK_SIZE)
+                if sent == 0:
+                    if os.lseek(infd, 0, os.SEEK_CUR) >= os.fstat(infd).st_size:
+                        return True
+                    break  # Came up short; let the next method carry on
+                if progress:
+                    progress(sent)
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP,
+                               errno.ENOTSUP, errno.EBADF, errno.EPERM, errno.ENOTTY):
+                raise
+    return False
+
+def _copy_buffered(fsrc, fdst, progress, digest=None):
+    """Copy the rest of fsrc into fdst through one reusable buffer, feeding digest along the way."""
+    buf = bytearray(CHUNK_SIZE)
+    view = memoryview(buf)
     while True:
-        new_path = f"{base}_{i}{ext}"
-        if not os.path.exists(new_path):
-            return new_path
-        i += 1
-
-def deepstash_item(target, config):
-    """Move a file or directory into the DeepStash directory and create a ghost file."""
-    if not os.path.exists(target):
-        print(f"❌ {target} does not exist.")
+        n = fsrc.readinto(buf)
+        if not n:
+            break
+        fdst.write(view[:n])
+        if digest is not None:
+            digest.update(view[:n])
+        if progress:
+            progress(n)
+
+def copy_file_data(src, dst, progress=None, digest=None):
+    """Copy the contents of src to dst using the fastest method the filesystems allow.
+
+    Tries a reflink clone first, then kernel-side copy_file_range/sendfile, and
+    finally a userspace loop over a preallocated buffer. progress, if given, is
+    called with the number of bytes copied after each chunk. With a hashlib
+    digest, the data has to pass through userspace, so the buffered loop is used
+    and hashes each chunk as it is copied.
+    """
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        if METRICS is not None:
+            count("files_copied")
+            count("bytes_copied", os.fstat(fsrc.fileno()).st_size)
+        if digest is not None:
+            _copy_buffered(fsrc, fdst, progress, digest)
+            return
+        if _clone_file(fsrc, fdst):
+            if progress:
+                progress(os.fstat(fsrc.fileno()).st_size)
+            return
+        if not _copy_kernel(fsrc, fdst, progress):
+            _copy_buffered(fsrc, fdst, progress)
+
+def copy_file(src, dst, progress=None, digest=None):
+    """Drop-in for shutil.copy2 that goes through copy_file_data."""
+    copy_file_data(src, dst, progress, digest)
+    shutil.copystat(src, dst)
+
+@contextmanager
+def progress_bar(progress, total, desc, unit="B"):
+    """Yield an update callback: the caller's shared progress if given, otherwise a new tqdm bar."""
+    if progress is not None:
+        yield progress
         return
+    with tqdm(total=total, unit=unit, unit_scale=(unit == "B"), desc=desc) as pbar:
+        yield pbar.update
 
-    # Determine the base name for the target to store in stash
+def _zstd_codec():
+    """Return (compress, reader) for zstd from the standard library or the zstandard package, if either exists."""
+    try:
+        from compression import zstd  # Python 3.14+
+        return zstd.compress, lambda f: zstd.ZstdFile(f, "rb")
+    except ImportError:
+        pass
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return (lambda data: zstandard.ZstdCompressor().compress(data),
+            lambda f: zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True))
+
+CODECS = {"gzip": (functools.partial(gzip.compress, compresslevel=6),
+                   lambda f: gzip.GzipFile(fileobj=f, mode="rb"))}
+if lzma is not None:
+    CODECS["lzma"] = (lzma.compress, lambda f: lzma.LZMAFile(f))
+
+def available_codecs():
+    """Names of the compression codecs usable in this Python."""
+    return [name for name in ("zstd", "lzma", "gzip") if get_codec(name) is not None]
+
+def get_codec(name):
+    """Return (compress, reader) for a codec name, or None if it isn't available here."""
+    if name == "zstd" and name not in CODECS:
+        codec = _zstd_codec()
+        if codec is not None:
+            CODECS[name] = codec
+    return CODECS.get(name)
+
+def should_compress(path):
+    """Whether a file is worth compressing, judging by its extension."""
+    return os.path.splitext(path)[1].lower() not in ALREADY_COMPRESSED
+
+def compress_file(src, dst, codec, progress=None, pool=None, digest=None):
+    """Compress src into dst as a series of independently compressed blocks.
+
+    Each block is a complete gzip member, xz stream or zstd frame, so with a
+    CopyPool the blocks are compressed in parallel on its workers and written
+    in order, and the result still reads back as a single stream. Sharing the
+    pool keeps a batch of compressed files within its concurrency limit.
+    digest, if given, is fed the uncompressed data as it is read.
+    """
+    compress = get_codec(codec)[0]
+
+    def read_blocks(fsrc):
+        while True:
+            block = fsrc.read(COMPRESS_BLOCK_SIZE)
+            if not block:
+                return
+            if digest is not None:
+                digest.update(block)
+            count("bytes_copied", len(block))
+            yield block
+
+    count("files_copied")
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        blocks = read_blocks(fsrc)
+        wrote = False
+        if pool is None or pool.jobs <= 1:
+            for block in blocks:
+                fdst.write(compress(block))
+                wrote = True
+                if progress:
+                    progress(len(block))
+        else:
+            pending = deque()
+            for block in blocks:
+                pending.append((pool.submit(len(block), compress, block), len(block)))
+                # Keep a couple of blocks per worker in flight, no more
+                while len(pending) >= pool.jobs * 2 or (pending and pending[0][0].done()):
+                    future, size = pending.popleft()
+                    fdst.write(future.result())
+                    wrote = True
+                    if progress:
+                        progress(size)
+            for future, size in pending:
+                fdst.write(future.result())
+                wrote = True
+                if progress:
+                    progress(size)
+        if not wrote:
+            # An empty file still needs a valid (empty) stream
+            fdst.write(compress(b""))
+
+def decompress_file(src, dst, codec, progress=None, digest=None):
+    """Decompress src into dst while streaming; progress counts compressed bytes read.
+
+    digest, if given, is fed the decompressed data.
+    """
+    count("files_copied")
+    with open(src, "rb") as raw, open(dst, "wb") as fdst:
+        reader = get_codec(codec)[1](raw)
+        pos = 0
+        while True:
+            chunk = reader.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            fdst.write(chunk)
+            count("bytes_copied", len(chunk))
+            if digest is not None:
+                digest.update(chunk)
+            if progress:
+                now = raw.tell()
+                progress(now - pos)
+                pos = now
+
+def stash_file(src, dst, codec=None, digest=None):
+    """Copy one file into the stash, compressing it if a codec is given; returns the stored path."""
+    if codec is None or not should_compress(src):
+        copy_file(src, dst, digest=digest)
+        return dst
+    dst += COMPRESSED_SUFFIX
+    compress_file(src, dst, codec, digest=digest)
+    shutil.copystat(src, dst)
+    return dst
+
+def default_jobs():
+    """Pick a worker count for copying; copies are I/O bound so oversubscribe the CPUs."""
+    return min(32, (os.cpu_count() or 1) + 4)
+
+class CopyPool:
+    """A bounded pool of copy workers, optionally with a separate queue for large files."""
+
+    def __init__(self, jobs=None, split_large=False):
+        self.jobs = jobs or default_jobs()
+        self.large = None
+        if split_large and self.jobs > 1:
+            large_jobs = max(1, self.jobs // 4)
+            self.small = ThreadPoolExecutor(max_workers=self.jobs - large_jobs)
+            self.large = ThreadPoolExecutor(max_workers=large_jobs)
+        else:
+            self.small = ThreadPoolExecutor(max_workers=self.jobs)
+
+    def _executor_for(self, size):
+        if self.large is not None and size >= LARGE_FILE_SIZE:
+            return self.large
+        return self.small
+
+    def submit(self, size, fn, *args):
+        """Queue a single task on the pool and return its future."""
+        return self._executor_for(size).submit(fn, *args)
+
+    def call(self, size, fn, *args):
+        """Run a single task on the pool and wait for its result."""
+        return self.submit(size, fn, *args).result()
+
+    def run(self, tasks):
+        """Run (size, fn, args) tasks and yield each result as soon as it finishes.
+
+        Large files are queued up front on their own workers when splitting is on.
+        Everything else is fed in with a bounded number in flight, so a tree with
+        hundreds of thousands of files never turns into that many pending futures.
+        """
+        large = set()
+        small = []
+        for size, fn, args in tasks:
+            if self._executor_for(size) is self.large:
+                large.add(self.large.submit(fn, *args))
+            else:
+                small.append((fn, args))
+        in_flight = set()
+        for fn, args in small:
+            if len(in_flight) >= self.jobs * 4:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                done |= {f for f in large if f.done()}
+                large -= done
+                for future in done:
+                    yield future.result()
+            in_flight.add(self.small.submit(fn, *args))
+        for future in as_completed(in_flight | large):
+            yield future.result()
+
+    def shutdown(self):
+        self.small.shutdown()
+        if self.large is not None:
+            self.large.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        return False
+
+def scan_tree(src):
+    """Walk a directory once, returning its relative subdirectories and (relative path, size) files."""
+    dirs = []
+    files = []
+    with phase("walk"):
+        for root, _, names in os.walk(src):
+            rel_root = os.path.relpath(root, src)
+            if rel_root != ".":
+                dirs.append(rel_root)
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    size = os.stat(path).st_size
+                except OSError:
+                    size = 0
+                files.append((os.path.normpath(os.path.join(rel_root, name)), size))
+    return dirs, files
+
+def _stash_copy_one(src_file, dst_file, size, codec=None, journal=None, rel=None, checksums=None):
+    """Copy a single file for a directory stash; returns (skip message or None, size) instead of raising.
+
+    With a checksums dict, the file's SHA-256 is taken during the copy and stored under rel.
+    """
+    digest = hashlib.sha256() if checksums is not None else None
+    try:
+        st = os.stat(src_file)
+        stored_file = stash_file(src_file, dst_file, codec, digest)
+        if journal is not None:
+            # The journal may only vouch for data that is already on disk
+            _fsync(stored_file)
+            stored = os.stat(stored_file).st_size
+    except FileNotFoundError:
+        return f"⚠️ Skipping missing file: {src_file}", size
+    except PermissionError as e:
+        return f"⚠️ Permission denied copying {src_file}. Skipping. Details: {e}", size
+    if digest is not None:
+        checksums[rel] = digest.hexdigest()
+    if journal is not None:
+        journal.record(rel, st.st_size, st.st_mtime, digest.hexdigest() if digest is not None else None, stored)
+    return None, size
+
+def parallel_copytree(src, dst, pool=None, progress=None, codec=None, journal=None, checksums=None):
+    """Copy a directory tree using a worker pool, creating every directory up front.
+
+    With a codec, compressible files are compressed on the workers as they are
+    copied and stored with the .dsz suffix. With a journal, every finished file
+    is recorded, and files it lists as done (and unchanged since) are skipped.
+    With a checksums dict, each copied file's SHA-256 is added to it.
+
+    With a shared progress callback, progress is reported in bytes per finished
+    file; otherwise the copy gets its own per-file progress bar.
+    Returns (total bytes, file count) of the source tree.
+    """
+    dirs, files = scan_tree(src)
+    with phase("mkdir"):
+        os.makedirs(dst, exist_ok=True)
+        for rel_dir in dirs:
+            os.makedirs(os.path.join(dst, rel_dir), exist_ok=True)
+    count("dirs_created", len(dirs) + 1)
+    tasks = []
+    resumed = 0
+    for rel, size in files:
+        src_file = os.path.join(src, rel)
+        if journal is not None and rel in journal.done:
+            try:
+                st = os.stat(src_file)
+            except OSError:
+                st = None
+            if st is not None and journal.is_done(rel, st.st_size, st.st_mtime, os.path.join(dst, rel)):
+                resumed += 1
+                continue
+        tasks.append((size, _stash_copy_one,
+                      (src_file, os.path.join(dst, rel), size, codec, journal, rel, checksums)))
+    if resumed:
+        print(f"⏭️ {resumed} files were already copied before the interruption.")
+    own_pool = pool is None
+    if own_pool:
+        pool = CopyPool(JOBS, SPLIT_LARGE)
+    try:
+        # Copy files with a single progress bar
+        with phase("copy"), progress_bar(progress, len(tasks), "📦 Progress", unit="file") as update:
+            for message, size in pool.run(tasks):
+                if message:
+                    print(message)
+                update(size if progress is not None else 1)
+    finally:
+        if own_pool:
+            pool.shutdown()
+    return sum(size for _, size in files), len(files)
+
+def blob_name(digest, codec=None):
+    """File name of a blob: its digest, plus the codec if the blob is stored compressed."""
+    return f"{digest}.{codec}" if codec else digest
+
+def blob_path(meta_dir, digest, codec=None):
+    """Where the blob with the given digest lives in a stash's blob store."""
+    return os.path.join(meta_dir, "blobs", digest[:2], blob_name(digest, codec))
+
+def hash_file(path):
+    """Return the SHA-256 hex digest of a file, read in one streaming pass."""
+    digest = hashlib.sha256()
+    buf = bytearray(CHUNK_SIZE)
+    view = memoryview(buf)
+    with open(path, "rb") as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            digest.update(view[:n])
+    return digest.hexdigest()
+
+def store_blob(meta_dir, src, codec=None):
+    """Hash src and copy it into the blob store unless an identical blob is already there.
+
+    The hash is taken locally first, so a file the store already holds costs
+    one read of the source and no writes to the stash device.
+    With a codec, a new blob for a compressible file is stored compressed.
+    Returns (digest, stored, blob codec) where stored says whether any data had to be written.
+    """
+    digest = hash_file(src)
+    if codec is not None and not should_compress(src):
+        codec = None
+    for existing in dict.fromkeys((None, codec)):
+        path = blob_path(meta_dir, digest, existing)
+        if os.path.exists(path):
+            # Refresh the mtime so a concurrent --gc treats the blob as in use
+            os.utime(path)
+            return digest, False, existing
+    path = blob_path(meta_dir, digest, codec)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    try:
+        if codec is None:
+            copy_file_data(src, tmp)
+        else:
+            compress_file(src, tmp, codec)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    os.replace(tmp, path)
+    return digest, True, codec
+
+def read_manifest(path):
+    """Load a dedup manifest, returning None if it is unreadable."""
+    try:
+        with open(path, "r") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return manifest if isinstance(manifest, dict) and "files" in manifest else None
+
+def write_json_atomic(path, data):
+    """Write JSON to a temporary file and rename it into place so readers never see half a file."""
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+def _dedup_one(meta_dir, src_file, rel, size, codec=None):
+    """Store one file as a blob; returns (skip message or None, manifest entry, bytes written, size)."""
+    try:
+        st = os.stat(src_file)
+        digest, stored, blob_codec = store_blob(meta_dir, src_file, codec)
+    except FileNotFoundError:
+        return f"⚠️ Skipping missing file: {src_file}", None, 0, size
+    except PermissionError as e:
+        return f"⚠️ Permission denied copying {src_file}. Skipping. Details: {e}", None, 0, size
+    entry = {"path": rel, "digest": digest, "size": st.st_size,
+             "mtime": st.st_mtime, "mode": stat.S_IMODE(st.st_mode)}
+    if blob_codec:
+        entry["codec"] = blob_codec
+    return None, entry, st.st_size if stored else 0, size
+
+def dedup_stash(target, config, pool=None, progress=None, codec=None):
+    """Stash target into the content-addressed blob store.
+
+    Every file is hashed and only copied if no blob with the same digest exists
+    yet; the tree itself is recorded in a manifest. Returns (manifest path, (bytes, files)).
+    """
+    meta_dir = meta_path(config)
+    if os.path.isdir(target):
+        kind = "dir"
+        dirs, files = scan_tree(target)
+        tasks = [(size, _dedup_one, (meta_dir, os.path.join(target, rel), rel, size, codec))
+                 for rel, size in files]
+    else:
+        kind = "file"
+        dirs, files = [], [(".", os.path.getsize(target))]
+        tasks = [(files[0][1], _dedup_one, (meta_dir, target, ".", files[0][1], codec))]
+    total = sum(size for _, size in files)
+    entries = []
+    written = 0
+    own_pool = pool is None
+    if own_pool:
+        pool = CopyPool(JOBS, SPLIT_LARGE)
+    try:
+        with phase("copy"), progress_bar(progress, total, "🧬 Progress") as update:
+            for message, entry, new_bytes, size in pool.run(tasks):
+                if message:
+                    print(message)
+                else:
+                    entries.append(entry)
+                    written += new_bytes
+                update(size)
+    finally:
+        if own_pool:
+            pool.shutdown()
+    entries.sort(key=lambda e: e["path"])
+    manifest = {"type": kind, "dirs": dirs, "files": entries}
+    os.makedirs(os.path.join(meta_dir, "manifests"), exist_ok=True)
     base_name = os.path.basename(os.path.abspath(target))
-    # Get a unique destination path inside the stash root
-    dest = get_unique_path(os.path.join(config["root"], base_name))
+    manifest_path = get_unique_path(os.path.join(meta_dir, "manifests", base_name + ".json"))
+    write_json_atomic(manifest_path, manifest)
+    print(f"🧬 Deduplicated: copied {format_size(written)} of {format_size(total)}.")
+    return manifest_path, (sum(e["size"] for e in entries), len(entries))
 
-    print(f"🔄 Stashing: {target}")
+def _restore_blob(meta_dir, entry, dst_file, journal=None, verify=False):
+    """Copy one blob back out and reapply the file's mode and mtime.
 
+    With verify, the blob is hashed on the way out and must match its digest.
+    """
+    if journal is not None and journal.is_done(entry["path"], entry["size"], entry["mtime"], dst_file):
+        return None, entry["size"]
+    digest = hashlib.sha256() if verify else None
     try:
-        # Ensure the stash destination is writable
-        if not os.access(config["root"], os.W_OK):
-            raise PermissionError(f"Stash directory '{config['root']}' is not writable.")
+        codec = entry.get("codec")
+        if codec:
+            decompress_file(blob_path(meta_dir, entry["digest"], codec), dst_file, codec, digest=digest)
+        else:
+            copy_file_data(blob_path(meta_dir, entry["digest"]), dst_file, digest=digest)
+        if digest is not None and digest.hexdigest() != entry["digest"]:
+            return f"❌ Checksum mismatch restoring {dst_file}: the blob is corrupt.", entry["size"]
+        os.chmod(dst_file, entry["mode"])
+        os.utime(dst_file, (entry["mtime"], entry["mtime"]))
+    except OSError as e:
+        return f"⚠️ Could not restore {dst_file}: {e}", entry["size"]
+    if journal is not None:
+        journal.record(entry["path"], entry["size"], entry["mtime"], stored=entry["size"])
+    return None, entry["size"]
+
+def dedup_restore(ghost, pool=None, progress=None, journal=None, verify=False):
+    """Rebuild a deduplicated item from its manifest and blobs. Returns True if every file came back.
+
+    With verify, every blob is checked against its digest while it is copied.
+    """
+    manifest = read_manifest(ghost["deep"])
+    if manifest is None:
+        print(f"❌ Cannot read the manifest at '{ghost['deep']}'.")
+        return False
+    meta_dir = os.path.dirname(os.path.dirname(ghost["deep"]))
+    original = ghost["original"]
+    with phase("mkdir"):
+        if manifest["type"] == "dir":
+            os.makedirs(original, exist_ok=True)
+            for rel_dir in manifest["dirs"]:
+                os.makedirs(os.path.join(original, rel_dir), exist_ok=True)
+            count("dirs_created", len(manifest["dirs"]) + 1)
+        else:
+            os.makedirs(os.path.dirname(original), exist_ok=True)
+    tasks = [(e["size"], _restore_blob,
+              (meta_dir, e, original if e["path"] == "." else os.path.join(original, e["path"]), journal, verify))
+             for e in manifest["files"]]
+    failures = 0
+    own_pool = pool is None
+    if own_pool:
+        pool = CopyPool(JOBS, SPLIT_LARGE)
+    try:
+        with phase("copy"), \
+                progress_bar(progress, sum(e["size"] for e in manifest["files"]), "♻️ Progress") as update:
+            for message, size in pool.run(tasks):
+                if message:
+                    print(message)
+                    failures += 1
+                update(size)
+    finally:
+        if own_pool:
+            pool.shutdown()
+    if failures:
+        print(f"❌ {failures} files could not be restored; keeping the stashed copy and the .ds file.")
+        return False
+    return True
+
+def collect_garbage(config):
+    """Delete blobs that no manifest references any more."""
+    meta_dir = meta_path(config)
+    manifests_dir = os.path.join(meta_dir, "manifests")
+    referenced = set()
+    if os.path.isdir(manifests_dir):
+        for entry in os.scandir(manifests_dir):
+            if not entry.name.endswith(".json"):
+                continue
+            manifest = read_manifest(entry.path)
+            if manifest is None:
+                # Deleting blobs without knowing what this manifest needs could lose data
+                print(f"❌ Cannot read manifest '{entry.path}'. Not collecting garbage.")
+                return
+            referenced.update(blob_name(f["digest"], f.get("codec")) for f in manifest["files"])
+    now = time.time()
+    removed = 0
+    freed = 0
+    for dirpath, _, names in os.walk(os.path.join(meta_dir, "blobs")):
+        for name in names:
+            if name in referenced:
+                continue
+            path = os.path.join(dirpath, name)
+            try:
+                st = os.stat(path)
+                if now - st.st_mtime < GC_GRACE_SECONDS:
+                    continue
+                os.remove(path)
+            except OSError:
+                continue
+            removed += 1
+            freed += st.st_size
+    print(f"🧹 Removed {removed} unreferenced blobs, freeing {format_size(freed)}.")
+
+def _zip_method(codec, name):
+    """The zip compression method for a member, following the --compress codec."""
+    if codec is None or not should_compress(name):
+        return zipfile.ZIP_STORED
+    if codec == "gzip":
+        return zipfile.ZIP_DEFLATED
+    if codec == "lzma":
+        return zipfile.ZIP_LZMA
+    return getattr(zipfile, "ZIP_ZSTANDARD", zipfile.ZIP_DEFLATED)
 
-        if os.path.isdir(target):
-            print("📁 Copying directory...")
-            # Gather all files in the directory tree first
-            all_files = []
-            for root, dirs, files in os.walk(target):
-                for file in files:
-                    all_files.append(os.path.join(root, file))
-            # Copy files with a single progress bar
-            for src_file in tqdm(all_files, desc="📦 Progress", unit="file"):
-                rel_path = os.path.relpath(src_file, target)
-                dst_file = os.path.join(dest, rel_path)
-                os.makedirs(os.path.dirname(dst_file), exist_ok=True)
+def is_pack(path):
+    """Whether a stashed directory is a pack of zip segments rather than a plain copy."""
+    return os.path.isfile(os.path.join(path, PACK_INDEX_NAME))
+
+def pack_tree(src, dst, progress=None, codec=None):
+    """Stream a directory tree into sequential zip segments inside dst.
+
+    Files are written one after another into the current segment, so the stash
+    target sees a few large sequential writes instead of one create per file.
+    Each segment's zip central directory records every member's offset.
+    Zip timestamps only go down to 1980 in 2-second steps, so exact mtimes
+    are kept in pack.json.
+    Returns (total bytes, file count) of what was packed.
+    """
+    dirs, files = scan_tree(src)
+    os.makedirs(dst)
+    segments = []
+    mtimes = {}
+    packed_bytes = 0
+    packed_files = 0
+    buf = bytearray(CHUNK_SIZE)
+    view = memoryview(buf)
+
+    def new_segment():
+        segments.append(f"segment-{len(segments):04d}.zip")
+        return zipfile.ZipFile(os.path.join(dst, segments[-1]), "w", allowZip64=True, strict_timestamps=False)
+
+    zf = new_segment()
+    segment_bytes = 0
+    try:
+        for rel_dir in dirs:
+            zf.write(os.path.join(src, rel_dir), rel_dir)
+        with phase("copy"), progress_bar(progress, sum(size for _, size in files), "📦 Packing") as update:
+            for rel, size in files:
+                if segment_bytes >= PACK_SEGMENT_SIZE:
+                    zf.close()
+                    zf = new_segment()
+                    segment_bytes = 0
+                src_file = os.path.join(src, rel)
                 try:
-                    shutil.copy2(src_file, dst_file)
+                    info = zipfile.ZipInfo.from_file(src_file, rel, strict_timestamps=False)
+                    info.compress_type = _zip_method(codec, rel)
+                    with open(src_file, "rb") as fsrc, zf.open(info, "w") as fdst:
+                        mtimes[rel] = os.fstat(fsrc.fileno()).st_mtime_ns
+                        while True:
+                            n = fsrc.readinto(buf)
+                            if not n:
+                                break
+                            fdst.write(view[:n])
+                            update(n)
                 except FileNotFoundError:
                     print(f"⚠️ Skipping missing file: {src_file}")
                     continue
                 except PermissionError as e:
                     print(f"⚠️ Permission denied copying {src_file}. Skipping. Details: {e}")
                     continue
-            # Remove the original directory after copying
-            shutil.rmtree(target)
+                segment_bytes += info.compress_size
+                packed_bytes += info.file_size
+                packed_files += 1
+                count("files_copied")
+                count("bytes_copied", info.file_size)
+    finally:
+        zf.close()
+    write_json_atomic(os.path.join(dst, PACK_INDEX_NAME),
+                      {"segments": segments, "files": packed_files, "bytes": packed_bytes, "mtimes": mtimes})
+    return packed_bytes, packed_files
+
+def read_pack_index(path):
+    """Load a pack's pack.json."""
+    with open(os.path.join(path, PACK_INDEX_NAME), "r") as f:
+        return json.load(f)
+
+def _extract_member(zf, info, dst, progress=None, mtime_ns=None):
+    """Extract one zip member to dst, restoring its mode and modification time.
+
+    mtime_ns is the exact mtime from pack.json; packs made without it fall
+    back to the zip timestamp.
+    """
+    if info.is_dir():
+        os.makedirs(dst, exist_ok=True)
+        return
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    count("files_copied")
+    count("bytes_copied", info.file_size)
+    with zf.open(info) as fsrc, open(dst, "wb") as fdst:
+        while True:
+            chunk = fsrc.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            fdst.write(chunk)
+            if progress:
+                progress(len(chunk))
+    mode = info.external_attr >> 16
+    if mode:
+        os.chmod(dst, stat.S_IMODE(mode))
+    if mtime_ns is not None:
+        os.utime(dst, ns=(mtime_ns, mtime_ns))
+    else:
+        mtime = time.mktime(info.date_time + (0, 0, -1))
+        os.utime(dst, (mtime, mtime))
+
+def unpack_tree(src, dst, progress=None, members=None, journal=None):
+    """Extract a packed stash into dst, segment by segment.
+
+    members limits extraction to the given file paths; each one is found
+    through the segment's zip index and read by seeking straight to it.
+    With a journal, every extracted file is recorded, and files it lists as
+    done (and still intact at dst) are skipped.
+    Returns a list of (member, destination, error) for members that failed.
+    """
+    errors = []
+    remaining = set(members) if members is not None else None
+    dst_root = os.path.abspath(dst)
+    index = read_pack_index(src)
+    mtimes = index.get("mtimes", {})
+    for segment in index["segments"]:
+        with zipfile.ZipFile(os.path.join(src, segment)) as zf:
+            if remaining is None:
+                infos = zf.infolist()
+            else:
+                infos = []
+                for name in list(remaining):
+                    try:
+                        info = zf.getinfo(name)
+                    except KeyError:
+                        continue
+                    if not info.is_dir():
+                        infos.append(info)
+                        remaining.discard(name)
+            for info in infos:
+                target = os.path.abspath(os.path.join(dst_root, *info.filename.rstrip("/").split("/")))
+                if not target.startswith(dst_root + os.sep):
+                    errors.append((info.filename, target, "member path escapes the restore location"))
+                    continue
+                mtime_ns = mtimes.get(info.filename)
+                if (journal is not None and not info.is_dir()
+                        and journal.is_done(info.filename, info.file_size, mtime_ns, target)):
+                    if progress:
+                        progress(info.file_size)
+                    continue
+                try:
+                    with phase("copy"):
+                        _extract_member(zf, info, target, progress, mtime_ns)
+                    if journal is not None and not info.is_dir():
+                        journal.record(info.filename, info.file_size, mtime_ns, stored=info.file_size)
+                except (OSError, zipfile.BadZipFile) as e:
+                    errors.append((info.filename, target, str(e)))
+                    if VERBOSE:
+                        print(f"⚠️ Skipping {info.filename}: {e}")
+        if remaining is not None and not remaining:
+            break
+    for name in sorted(remaining or ()):
+        errors.append((name, os.path.join(dst, name), "not in the pack"))
+    if errors:
+        print(f"\n⚠️ Total files skipped during unpack: {len(errors)}\n")
+    return errors
+
+def checksums_path(config, deep):
+    """Where the per-file checksums of a stashed directory are kept."""
+    return meta_path(config, "checksums", os.path.basename(deep) + ".json")
+
+def remove_checksums(ghost):
+    """Delete a stashed item's checksum sidecar, if it has one."""
+    path = ghost.get("checksums")
+    if path and os.path.exists(path):
+        os.remove(path)
+
+class RateLimiter:
+    """Pace reads from any number of threads to a combined number of bytes per second."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self, n):
+        """Block until n more bytes fit within the rate."""
+        with self._lock:
+            now = time.monotonic()
+            start = max(self._next, now)
+            self._next = start + n / self.rate
+        if start > now:
+            time.sleep(start - now)
+
+def _read_through(f, digest=None, limiter=None):
+    """Read a stream to the end in chunks, hashing and pacing as asked."""
+    while True:
+        chunk = f.read(CHUNK_SIZE)
+        if not chunk:
+            return
+        if limiter is not None:
+            limiter.wait(len(chunk))
+        if digest is not None:
+            digest.update(chunk)
+
+def _verify_file(path, codec, expected, limiter=None):
+    """Hash one stashed file (decompressing it if needed); returns a problem description or None."""
+    digest = hashlib.sha256()
+    try:
+        with open(path, "rb") as raw:
+            if codec:
+                with get_codec(codec)[1](raw) as reader:
+                    _read_through(reader, digest, limiter)
+            else:
+                _read_through(raw, digest, limiter)
+    except FileNotFoundError:
+        return "missing"
+    except Exception as e:
+        return f"unreadable: {e}"
+    return None if digest.hexdigest() == expected else "checksum mismatch"
+
+def _verify_segment(path, limiter=None):
+    """Read every member of a pack segment, letting zipfile check each one's CRC-32."""
+    try:
+        with zipfile.ZipFile(path) as zf:
+            for info in zf.infolist():
+                if not info.is_dir():
+                    with zf.open(info) as member:
+                        _read_through(member, limiter=limiter)
+    except FileNotFoundError:
+        return "missing"
+    except Exception as e:
+        return f"corrupt: {e}"
+    return None
+
+def _report(problem, limiter=None):
+    """A check that has already failed before reading anything."""
+    return problem
+
+def verify_tasks(ghost):
+    """List the checks for one stashed item as (label, function, args), or None if it has no checksums."""
+    deep = ghost["deep"]
+    if ghost.get("store") == "cas":
+        manifest = read_manifest(deep)
+        if manifest is None:
+            return [(deep, _report, ("missing manifest",))]
+        meta_dir = os.path.dirname(os.path.dirname(deep))
+        blobs = {blob_path(meta_dir, e["digest"], e.get("codec")): e for e in manifest["files"]}
+        return [(path, _verify_file, (path, e.get("codec"), e["digest"])) for path, e in blobs.items()]
+    if ghost.get("store") == "pack":
+        try:
+            segments = read_pack_index(deep)["segments"]
+        except (OSError, ValueError) as e:
+            return [(deep, _report, (f"unreadable pack index: {e}",))]
+        return [(os.path.join(deep, s), _verify_segment, (os.path.join(deep, s),)) for s in segments]
+    codec = ghost.get("codec")
+    if ghost.get("sha256"):
+        return [(deep, _verify_file, (deep, codec, ghost["sha256"]))]
+    sidecar = read_manifest(ghost["checksums"]) if ghost.get("checksums") else None
+    if sidecar is None:
+        return None
+    tasks = []
+    for rel, expected in sidecar["files"].items():
+        path = os.path.join(deep, rel)
+        if codec and os.path.isfile(path + COMPRESSED_SUFFIX):
+            tasks.append((path, _verify_file, (path + COMPRESSED_SUFFIX, codec, expected)))
+        else:
+            tasks.append((path, _verify_file, (path, None, expected)))
+    return tasks
+
+def verify_stashes(config, ghost_files=None, rate=None):
+    """Check stashed items against their checksums with a pool of hashing workers.
+
+    ghost_files defaults to every item in the catalog that has a ghost. rate
+    caps the combined read speed in MB/s so a nightly run doesn't hog the drive.
+    Returns True if every check passed.
+    """
+    if not ghost_files:
+        ghost_files = []
+        for tier in stash_tiers(config):
+            if os.path.isdir(tier["root"]):
+                with closing(open_catalog(tier)) as conn:
+                    ghost_files += [row[0] for row in conn.execute("SELECT ghost FROM items WHERE ghost IS NOT NULL")]
+    tasks = []
+    unchecked = []
+    for ghost_file in ghost_files:
+        ghost = read_ghost(ghost_file)
+        if ghost is None:
+            print(f"⚠️ Cannot read '{ghost_file}'. Skipping.")
+            continue
+        item_tasks = verify_tasks(ghost)
+        if item_tasks is None:
+            unchecked.append(ghost_file)
+        else:
+            tasks.extend(item_tasks)
+    limiter = RateLimiter(rate * 1024 * 1024) if rate else None
+    failures = []
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=JOBS or os.cpu_count() or 1) as executor, \
+            tqdm(total=len(tasks), unit="file", desc="🔐 Verifying") as pbar:
+        futures = {executor.submit(fn, *args, limiter=limiter): label for label, fn, args in tasks}
+        for future in as_completed(futures):
+            problem = future.result()
+            if problem:
+                failures.append((futures[future], problem))
+            pbar.update(1)
+    for label, problem in sorted(failures):
+        print(f"❌ {label}: {problem}")
+    print(f"🔐 Checked {len(tasks)} files in {time.monotonic() - started:.1f}s: {len(failures)} failed, "
+          f"{len(unchecked)} items had no checksums.")
+    for ghost_file in unchecked:
+        if VERBOSE:
+            print(f"  ⏭️ {ghost_file}")
+    return not failures
+
+def kept_manifest_path(config, deep):
+    """Where the manifest of a copy kept by 'restore --keep' lives."""
+    return meta_path(config, "kept", os.path.basename(deep) + ".json")
+
+def keep_stashed(config, ghost):
+    """Leave a stashed item in place after restoring it and record what the restored files look like.
+
+    The manifest maps each stashed file to the (size, mtime) of its restored copy,
+    so a later stash of the same path can tell which files changed.
+    """
+    deep, original, codec = ghost["deep"], ghost["original"], ghost.get("codec")
+    files = {}
+    if ghost["type"] == "dir":
+        for rel, _ in scan_tree(deep)[1]:
+            if codec and rel.endswith(COMPRESSED_SUFFIX):
+                rel = rel[:-len(COMPRESSED_SUFFIX)]
+            try:
+                st = os.stat(os.path.join(original, rel))
+                files[rel] = [st.st_size, st.st_mtime]
+            except OSError:
+                # Not restored, so it can never match and will be recopied or deleted
+                files[rel] = None
+    else:
+        st = os.stat(original)
+        files["."] = [st.st_size, st.st_mtime]
+    os.makedirs(os.path.dirname(kept_manifest_path(config, deep)), exist_ok=True)
+    write_json_atomic(kept_manifest_path(config, deep),
+                      {"original": original, "deep": deep, "type": ghost["type"], "codec": codec, "files": files,
+                       "checksums": ghost.get("checksums"), "sha256": ghost.get("sha256")})
+    catalog_keep(config, deep)
+
+def find_kept(config, original):
+    """The kept-copy manifest for an original path restored with --keep, if there is one."""
+    try:
+        with closing(open_catalog(config)) as conn:
+            row = conn.execute("SELECT deep FROM items WHERE original = ? AND state = 'kept'",
+                               (original,)).fetchone()
+    except sqlite3.Error:
+        return None
+    if row is None or not os.path.exists(row[0]):
+        return None
+    return read_manifest(kept_manifest_path(config, row[0]))
+
+def discard_kept(config, kept):
+    """Delete a kept copy and its manifest."""
+    remove_stashed(kept)
+    remove_checksums(kept)
+    os.remove(kept_manifest_path(config, kept["deep"]))
+    catalog_forget(config, kept["deep"])
+
+def sync_kept(target, kept, pool=None, progress=None, journal=None, checksums=None):
+    """Bring a copy kept by 'restore --keep' up to date with target, rsync-style.
+
+    Files whose size and mtime still match the kept manifest are left alone,
+    changed and new files are copied, and files that are gone get deleted.
+    With a checksums dict (holding the kept copy's checksums), copied files are
+    hashed and deleted ones dropped from it.
+    Returns (total bytes, file count) of target.
+    """
+    dest, codec, old = kept["deep"], kept.get("codec"), kept["files"]
+    if kept["type"] == "file":
+        st = os.stat(target)
+        if old.get(".") == [st.st_size, st.st_mtime]:
+            print("🔁 Unchanged since it was restored; nothing to copy.")
         else:
-            print("📄 Copying file...")
-            # Copy the file in chunks to show a gradual progress bar
-            total_size = os.path.getsize(target)
-            chunk_size = 1024 * 1024  # 1 MiB per chunk
-            with open(target, "rb") as fsrc, open(dest, "wb") as fdst:
-                with tqdm(total=total_size, unit="B", unit_scale=True, desc="📦 Progress") as pbar:
-                    while True:
-                        chunk = fsrc.read(chunk_size)
-                        if not chunk:
-                            break
-                        fdst.write(chunk)
-                        pbar.update(len(chunk))
-            os.remove(target)
+            digest = hashlib.sha256() if checksums is not None else None
+            with phase("copy"), progress_bar(progress, st.st_size, "📦 Progress") as update:
+                if codec:
+                    compress_file(target, dest, codec, update, digest=digest)
+                else:
+                    copy_file_data(target, dest, update, digest)
+            if digest is not None:
+                checksums["."] = digest.hexdigest()
+        return st.st_size, 1
+
+    dirs = []
+    current = {}
+    for root, _, names in timed_walk(os.walk(target)):
+        rel_root = os.path.relpath(root, target)
+        if rel_root != ".":
+            dirs.append(rel_root)
+        for name in names:
+            try:
+                st = os.stat(os.path.join(root, name))
+            except OSError:
+                continue
+            current[os.path.normpath(os.path.join(rel_root, name))] = (st.st_size, st.st_mtime)
+    with phase("mkdir"):
+        for rel_dir in dirs:
+            os.makedirs(os.path.join(dest, rel_dir), exist_ok=True)
+
+    changed = [rel for rel, (size, mtime) in current.items()
+               if old.get(rel) != [size, mtime]
+               and not (journal and journal.is_done(rel, size, mtime, os.path.join(dest, rel)))]
+    deleted = [rel for rel in old if rel not in current]
+    for rel in deleted:
+        if checksums is not None:
+            checksums.pop(rel, None)
+        for name in (rel, rel + COMPRESSED_SUFFIX):
+            if os.path.lexists(os.path.join(dest, name)):
+                os.remove(os.path.join(dest, name))
+    # Drop directories that no longer exist in target (only if empty, to be safe)
+    live_dirs = set(dirs)
+    for root, _, _ in os.walk(dest, topdown=False):
+        rel_root = os.path.relpath(root, dest)
+        if rel_root != "." and rel_root not in live_dirs:
+            try:
+                os.rmdir(root)
+            except OSError:
+                pass
+
+    tasks = [(current[rel][0], _stash_copy_one,
+              (os.path.join(target, rel), os.path.join(dest, rel), current[rel][0], codec, journal, rel, checksums))
+             for rel in changed]
+    own_pool = pool is None
+    if own_pool:
+        pool = CopyPool(JOBS, SPLIT_LARGE)
+    try:
+        with phase("copy"), progress_bar(progress, len(tasks), "📦 Progress", unit="file") as update:
+            for message, size in pool.run(tasks):
+                if message:
+                    print(message)
+                update(size if progress is not None else 1)
+    finally:
+        if own_pool:
+            pool.shutdown()
+    print(f"🔁 Incremental stash: {len(changed)} changed or new, {len(deleted)} deleted, "
+          f"{len(current) - len(changed)} unchanged.")
+    return sum(size for size, _ in current.values()), len(current)
+
+def deepstash_item(target, config, pool=None, progress=None):
+    """Move a file or directory into the DeepStash directory and create a ghost file.
+
+    pool and progress let a batch share one copy scheduler and progress bar.
+    An interrupted stash of the same item is resumed from its journal.
+    Returns True if the item was stashed.
+    """
+    if "tiers" in config:
+        # Pick the tier, then stash there within that tier's own concurrency limit
+        tier = place_item(target, config)
+        if tier is None:
+            print(f"❌ No stash tier accepts {target} or has room for it.")
+            return False
+        print(f"🗄️ Tier: {tier['name']}")
+        if pool is None:
+            with CopyPool(tier.get("jobs") or JOBS, SPLIT_LARGE) as pool:
+                return deepstash_item(target, tier, pool, progress)
+        return deepstash_item(target, tier, pool, progress)
+    original = os.path.abspath(target)
+    # Pick up where an interrupted stash of the same item left off
+    journal = find_journal(config, "stash", original)
+    if journal is None and not os.path.exists(target):
+        print(f"❌ {target} does not exist.")
+        return False
+
+    # Determine the base name for the target to store in stash
+    base_name = os.path.basename(original)
+
+    print(f"🔄 Stashing: {target}")
+
+    kept = None
+    if journal is not None:
+        print("⏯️ Resuming an interrupted stash...")
+        if journal.header.get("incremental"):
+            kept = find_kept(config, original)
+        kind = journal.header["type"]
+        dedup = journal.header.get("store") == "cas"
+        pack = journal.header.get("store") == "pack"
+        codec = journal.header.get("codec")
+        checksum = journal.header.get("checksum", False)
+        dest = journal.copied or journal.header["dest"]
+    else:
+        kind = "dir" if os.path.isdir(target) else "file"
+        dedup = DEDUP or config.get("dedup", False)
+        codec = COMPRESS or config.get("compress")
+        if codec is not None and not dedup and kind == "file" and not should_compress(target):
+            codec = None
+        pack = (PACK or config.get("pack", False)) and kind == "dir" and not dedup
+        # Blobs are addressed by their hash and pack members carry a CRC, so only plain copies need one
+        checksum = (CHECKSUM or config.get("checksum", False)) and not dedup and not pack
+        # A copy kept by 'restore --keep' only needs the changes sent to it
+        kept = find_kept(config, original)
+        if kept is not None and (dedup or pack or kept["type"] != kind):
+            print("🗑️ Discarding the copy kept from the last restore, since this stash is stored differently.")
+            discard_kept(config, kept)
+            kept = None
+        # Get a unique destination path inside the stash root
+        if kept is not None:
+            codec = kept.get("codec")
+            dest = kept["deep"]
+        elif dedup:
+            dest = None  # The manifest path is picked once the blobs are stored
+        elif pack:
+            dest = get_unique_path(os.path.join(config["root"], base_name + PACK_SUFFIX))
+        elif codec is not None and kind == "file":
+            dest = get_unique_path(os.path.join(config["root"], base_name + COMPRESSED_SUFFIX))
+        else:
+            dest = get_unique_path(os.path.join(config["root"], base_name))
+    if codec is not None and get_codec(codec) is None:
+        print(f"❌ Compression codec '{codec}' is not available. Choose from: {', '.join(available_codecs())}.")
+        return False
+
+    stored = None  # (bytes, files) once known without another walk
+    checksums = None
+    if checksum:
+        # Files copied before an interruption, or unchanged in a kept copy, keep their earlier checksums
+        checksums = {}
+        if kept is not None and kept.get("checksums"):
+            checksums.update((read_manifest(kept["checksums"]) or {"files": {}})["files"])
+        if kept is not None and kept.get("sha256"):
+            checksums["."] = kept["sha256"]
+        if journal is not None:
+            checksums.update(journal.digests)
+    try:
+        # Ensure the stash destination is writable
+        if not os.access(config["root"], os.W_OK):
+            raise PermissionError(f"Stash directory '{config['root']}' is not writable.")
+
+        if journal is not None and journal.copied is not None:
+            # Everything reached the stash before the interruption; only cleanup is left
+            pass
+        elif (journal is None and kept is None and not dedup and not pack and codec is None
+                and not os.path.islink(target)
+                and same_filesystem(target, config["root"]) and rename_item(target, dest)):
+            # Same device as the stash root: a rename is atomic and moves no data
+            print("⚡ Same filesystem — moved without copying.")
+        else:
+            if journal is None:
+                store = "cas" if dedup else "pack" if pack else None
+                journal = Journal.start(config, "stash", original, dest, type=kind, store=store, codec=codec,
+                                        incremental=kept is not None, checksum=checksum)
+            if kept is not None:
+                print("🔁 Updating the copy kept from the last restore...")
+                stored = sync_kept(target, kept, pool, progress, journal, checksums)
+            elif dedup:
+                print("🧬 Storing in the deduplicating blob store...")
+                dest, stored = dedup_stash(target, config, pool, progress, codec)
+            elif pack:
+                print("🗃️ Packing directory into archive segments...")
+                if os.path.exists(dest):
+                    # A half-written pack can't be appended to, so it starts over
+                    shutil.rmtree(dest)
+                stored = pack_tree(target, dest, progress, codec)
+            elif kind == "dir":
+                print("📁 Copying directory...")
+                stored = parallel_copytree(target, dest, pool, progress, codec, journal, checksums)
+            else:
+                print("📄 Copying file...")
+                # Copy the file in chunks to show a gradual progress bar
+                st = os.stat(target)
+                total_size = st.st_size
+                digest = hashlib.sha256() if checksum else None
+                with phase("copy"), progress_bar(progress, total_size, "📦 Progress") as update:
+                    if codec is not None:
+                        print(f"🗜️ Compressing with {codec}...")
+                        if pool is not None:
+                            compress_file(target, dest, codec, update, pool, digest)
+                        else:
+                            with CopyPool(JOBS) as own_pool:
+                                compress_file(target, dest, codec, update, own_pool, digest)
+                    elif pool is not None:
+                        pool.call(total_size, copy_file_data, target, dest, update, digest)
+                    else:
+                        copy_file_data(target, dest, update, digest)
+                if digest is not None:
+                    checksums["."] = digest.hexdigest()
+                    journal.record(".", st.st_size, st.st_mtime, checksums["."])
+                stored = (total_size, 1)
+            synced = [dest]
+            if dedup:
+                meta_dir = meta_path(config)
+                synced += [blob_path(meta_dir, e["digest"], e.get("codec")) for e in read_manifest(dest)["files"]]
+            sync_to_disk(synced, pool)
+            journal.mark_copied(dest)
+
+        # Remove the original now that the stash holds all of it
+        with phase("delete"):
+            if os.path.isdir(target) and not os.path.islink(target):
+                shutil.rmtree(target)
+            elif os.path.lexists(target):
+                os.remove(target)
     except PermissionError as e:
         # Determine if the issue is with the stash directory or the target
         if not os.access(config["root"], os.W_OK):
             print(f"❌ Permission denied: Cannot write to stash directory '{config['root']}'.")
         else:
             print(f"❌ Permission denied while accessing '{target}'. Please check file permissions.\nDetails: {e}")
-        return
+        return False
 
     # Create a ghost file recording original path, stash path, type, and timestamp
     ghost = {
-        "original": os.path.abspath(target),
+        "original": original,
         "deep": dest,
-        "type": "dir" if os.path.isdir(dest) else "file",
+        "type": kind,
         "timestamp": datetime.now().isoformat()
     }
-    ghost_path = os.path.abspath(target) + ".ds"
-    # Write the ghost metadata to a .ds file alongside the original location
-    with open(ghost_path, "w") as f:
-        json.dump(ghost, f)
+    if dedup:
+        ghost["store"] = "cas"
+    elif pack:
+        ghost["store"] = "pack"
+    elif codec is not None:
+        ghost["codec"] = codec
+    ghost_path = original + ".ds"
+    if stored is not None:
+        size, files = stored
+    elif kind == "dir":
+        # Moved by a rename: measuring it would walk the whole tree, so --du or --reindex does it later
+        size, files = None, None
+    else:
+        size, files = item_size(dest)
+    with phase("ghost"):
+        if checksums and kind == "file":
+            ghost["sha256"] = checksums["."]
+        elif checksums:
+            os.makedirs(meta_path(config, "checksums"), exist_ok=True)
+            ghost["checksums"] = checksums_path(config, dest)
+            write_json_atomic(ghost["checksums"], {"files": checksums})
+        # Write the ghost metadata to a .ds file alongside the original location
+        with open(ghost_path, "w") as f:
+            json.dump(ghost, f)
+        catalog_record(config, ghost, ghost_path, size, files)
+        if kept is not None:
+            os.remove(kept_manifest_path(config, dest))
+        if journal is not None:
+            journal.finish()
+    count("items_stashed")
     print(f"📦 Stashed: {target} → {dest}")
+    return True
 
-def safe_copytree(src, dst, max_errors_per_dir=5):
+def _restore_copy_one(src_file, dst_file, rel_path, codec=None, journal=None, checksums=None, progress=None):
+    """Copy one file of a stashed directory back; returns (source, destination, error or None) instead of raising."""
+    compressed = codec and dst_file.endswith(COMPRESSED_SUFFIX)
+    if compressed:
+        dst_file = dst_file[:-len(COMPRESSED_SUFFIX)]
+    # Journaled under the restored name, which is what 'ds --abort' removes
+    logical = rel_path[:-len(COMPRESSED_SUFFIX)] if compressed else rel_path
+    try:
+        st = os.stat(src_file)
+        # Already restored before an interruption
+        if journal is not None and journal.is_done(logical, st.st_size, st.st_mtime, dst_file):
+            return src_file, dst_file, None
+        expected = checksums.get(logical) if checksums else None
+        digest = hashlib.sha256() if expected else None
+        # A file with a checksum only takes its real name once it has checked out
+        out_file = dst_file + PARTIAL_SUFFIX if expected else dst_file
+        if compressed:
+            decompress_file(src_file, out_file, codec, progress, digest)
+            shutil.copystat(src_file, out_file)
+        else:
+            copy_file(src_file, out_file, progress, digest)
+        if digest is not None and digest.hexdigest() != expected:
+            os.remove(out_file)
+            raise ValueError("checksum mismatch, the stashed copy is corrupt")
+        if out_file != dst_file:
+            os.replace(out_file, dst_file)
+        if journal is not None:
+            journal.record(logical, st.st_size, st.st_mtime, stored=os.stat(dst_file).st_size)
+    except Exception as e:
+        return src_file, dst_file, str(e)
+    return src_file, dst_file, None
+
+def safe_copytree(src, dst, max_errors_per_dir=5, progress=None, codec=None, journal=None, checksums=None,
+                  pool=None):
+    """Copy a stashed directory back to dst, skipping files that fail instead of stopping.
+
+    With a pool, each directory's files are copied on its workers, so a batch
+    restore shares the same bounded scheduler as stashing. Returns a list of
+    (source, destination, error) for the files that were skipped.
+    """
+    if is_pack(src):
+        return unpack_tree(src, dst, progress, journal=journal)
     total_skipped = 0
     errors = []
-    for root, dirs, files in os.walk(src):
+    for root, dirs, files in timed_walk(os.walk(src)):
         rel_root = os.path.relpath(root, src)
         # Early skip for directories full of unreadable .ds files
         if all(name.endswith(".ds") for name in files) and files:
@@ -144,52 +2126,164 @@ def safe_copytree(src, dst, max_errors_per_dir=5):
             if unreadable_ds == len(files):
                 print(f"🚫 Skipping directory '{rel_root}' — all files are unreadable .ds files.")
                 continue
-        error_count = 0
-        skip_count = 0
-        first_skip = None
-        skip_messages = []
+        if not files:
+            continue
+        with phase("mkdir"):
+            os.makedirs(os.path.normpath(os.path.join(dst, rel_root)), exist_ok=True)
+        tasks = []
         for name in files:
             src_file = os.path.join(root, name)
             rel_path = os.path.relpath(src_file, src)
-            dst_file = os.path.join(dst, rel_path)
-            os.makedirs(os.path.dirname(dst_file), exist_ok=True)
-            try:
-                shutil.copy2(src_file, dst_file)
-                error_count = 0  # reset on success
-            except Exception as e:
-                errors.append((src_file, dst_file, str(e)))
+            tasks.append((0, _restore_copy_one, (src_file, os.path.join(dst, rel_path), rel_path,
+                                                 codec, journal, checksums, progress)))
+        if pool is not None:
+            results = pool.run(tasks)
+        else:
+            results = (fn(*args) for _, fn, args in tasks)
+        error_count = 0
+        with phase("copy"):
+            for src_file, dst_file, error in results:
+                if error is None:
+                    error_count = 0  # reset on success
+                    continue
+                errors.append((src_file, dst_file, error))
                 error_count += 1
-                skip_count += 1
                 total_skipped += 1
                 if VERBOSE:
-                    print(f"⚠️ Skipping {src_file}: {e}")
-                if skip_count == 1:
-                    first_skip = src_file
+                    print(f"⚠️ Skipping {src_file}: {error}")
                 if error_count >= max_errors_per_dir:
+                    # Files already handed to the pool still finish; nothing more is queued
                     print(f"🚫 Too many errors in directory '{rel_root}'. Skipping the rest of this directory.")
                     break
     if total_skipped > 0:
         print(f"\n⚠️ Total files skipped during copy: {total_skipped}\n")
     return errors
 
-def restore(ghost_file):
-    """Restore a stashed file or directory using its .ds ghost metadata file."""
-    if not os.path.exists(ghost_file):
-        print("❌ .ds file not found.")
+def remove_stashed(ghost):
+    """Delete whatever is left of a stashed item at its 'deep' path."""
+    deep = ghost["deep"]
+    if os.path.isdir(deep) and not os.path.islink(deep):
+        shutil.rmtree(deep, ignore_errors=True)
+    elif os.path.lexists(deep):
+        os.remove(deep)
+    remove_checksums(ghost)
+
+def resume_journals(config):
+    """Finish every interrupted stash and restore. Returns True if all of them completed."""
+    journals = pending_journals(config)
+    if not journals:
+        print("✅ No interrupted operations to resume.")
+        return True
+    ok = True
+    for journal in journals:
+        journal.close()
+        op, target = journal.header["op"], journal.header["target"]
+        print(f"⏯️ Resuming {op} of {target}")
+        if op == "stash":
+            ok = deepstash_item(target, config) and ok
+        else:
+            ok = restore(target, config) and ok
+    return ok
+
+def abort_journals(config):
+    """Roll back every interrupted stash and restore that can still be undone safely."""
+    journals = pending_journals(config)
+    if not journals:
+        print("✅ No interrupted operations to abort.")
         return
+    for journal in journals:
+        journal.close()
+        op, target, dest = journal.header["op"], journal.header["target"], journal.header["dest"]
+        if journal.copied is not None:
+            # The source may already be partly deleted, so the copy is the only complete one
+            print(f"⚠️ The {op} of {target} had already copied everything. Run 'ds --resume' to finish it.")
+            continue
+        if op == "stash":
+            # The original is untouched; drop the partial copy in the stash
+            if dest:
+                remove_stashed({"deep": dest})
+        elif (read_ghost(target) or {}).get("type") == "file":
+            # A file restore journals nothing until it's done, so whatever is at dest is partial
+            for path in (dest + PARTIAL_SUFFIX, dest):
+                if os.path.isfile(path):
+                    os.remove(path)
+        else:
+            # The stash is untouched; drop the files restored so far and any still being verified
+            for rel in journal.done:
+                path = dest if rel == "." else os.path.join(dest, rel)
+                if os.path.isfile(path):
+                    os.remove(path)
+            for root, _, names in os.walk(dest):
+                for name in names:
+                    if name.endswith(PARTIAL_SUFFIX):
+                        os.remove(os.path.join(root, name))
+        os.remove(journal.path)
+        print(f"↩️ Rolled back the interrupted {op} of {target}")
+
+def is_plain_stash(ghost):
+    """Whether a stashed item is stored exactly as it was (no compression, blobs or pack), so it can simply be renamed back."""
+    return not ghost.get("codec") and not ghost.get("store")
+
+def stashed_size(ghost):
+    """Logical size in bytes of what a ghost's stashed item will restore to."""
+    if ghost.get("store") == "cas":
+        manifest = read_manifest(ghost["deep"]) or {"files": []}
+        return sum(f["size"] for f in manifest["files"])
+    if ghost.get("store") == "pack":
+        return read_pack_index(ghost["deep"])["bytes"]
+    return item_size(ghost["deep"])[0]
+
+def set_aside_materialized(ghost):
+    """Move materialized members that were changed since they came back out of the way of a full restore.
+
+    Only regular files are set aside. Returns (path, temporary path) pairs for
+    put_back_materialized.
+    """
+    aside = []
+    for member, (size, mtime) in ghost.get("materialized", {}).items():
+        path = os.path.join(ghost["original"], member)
+        try:
+            st = os.lstat(path)
+        except OSError:
+            continue
+        if stat.S_ISREG(st.st_mode) and (st.st_size, st.st_mtime) != (size, mtime):
+            os.replace(path, path + ".ds-local")
+            aside.append((path, path + ".ds-local"))
+    return aside
+
+def put_back_materialized(aside):
+    """Return local copies set aside by set_aside_materialized, replacing the stashed versions."""
+    for path, tmp in aside:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp, path)
+
+def restore(ghost_file, config=None, pool=None, progress=None):
+    """Restore a stashed file or directory using its .ds ghost metadata file.
+
+    pool and progress let a batch share one copy scheduler and progress bar.
+    Returns True if the item was restored.
+    """
+    if config is None:
+        config = load_config()
+    if "tiers" in config:
+        # Restore through the tier holding the item, within its concurrency limit
+        ghost = read_ghost(ghost_file)
+        tier = tier_for_path(config, ghost["deep"]) if ghost is not None else stash_tiers(config)[0]
+        if pool is None:
+            with CopyPool(tier.get("jobs") or JOBS, SPLIT_LARGE) as pool:
+                return restore(ghost_file, tier, pool, progress)
+        return restore(ghost_file, tier, pool, progress)
 
     # Load ghost metadata from the .ds file
-    with open(ghost_file, "r") as f:
-        ghost = json.load(f)
+    try:
+        with open(ghost_file, "r") as f:
+            ghost = json.load(f)
+    except FileNotFoundError:
+        print("❌ .ds file not found.")
+        return False
 
     # Backward compatibility: convert old format to new format
-    if "deep_stash_path" in ghost and "original_path" in ghost and "deep" not in ghost and "original" not in ghost:
-        ghost["deep"] = ghost.get("deep_stash_path")
-        ghost["original"] = ghost.get("original_path")
-        if "type" in ghost and ghost["type"] == "folder":
-            ghost["type"] = "dir"
-        elif "type" in ghost and ghost["type"] == "file":
-            ghost["type"] = "file"
+    if convert_legacy_ghost(ghost):
         print("🔁 Converted old .ds format to new format.")
 
     # Ensure all required keys are present
@@ -203,7 +2297,7 @@ def restore(ghost_file):
             print(f"🔧 Inferred 'original' as {ghost['original']}")
         if "deep" not in ghost:
             print("❌ Missing 'deep' (stash path) and cannot infer. Skipping.")
-            return
+            return False
         if "type" not in ghost:
             ghost["type"] = "dir" if os.path.isdir(ghost.get("deep", "")) else "file"
             print(f"🔧 Inferred 'type' as {ghost['type']}")
@@ -211,67 +2305,707 @@ def restore(ghost_file):
         # Validate again
         if not all(k in ghost for k in required_keys):
             print("❌ Auto-fix failed. Skipping file.")
-            return
+            return False
         else:
             # Save corrected ghost file
             with open(ghost_file, "w") as f:
                 json.dump(ghost, f, indent=2)
             print(f"✅ Auto-fix successful. .ds file '{ghost_file}' has been updated.")
 
-    # Validate that the stash location exists
-    if not os.path.exists(ghost["deep"]):
+    if ghost.get("codec") and get_codec(ghost["codec"]) is None:
+        print(f"❌ '{ghost_file}' was stashed with {ghost['codec']} compression, which is not available here.")
+        return False
+
+    # Pick up where an interrupted restore of this ghost left off
+    ghost_key = os.path.abspath(ghost_file)
+    journal = find_journal(config, "restore", ghost_key)
+    if journal is not None:
+        print("⏯️ Resuming an interrupted restore...")
+    finishing = journal is not None and journal.copied is not None
+    keep = journal.header.get("keep", False) if journal is not None else KEEP
+    if keep and ghost.get("store"):
+        print("ℹ️ --keep only applies to plain and compressed stashes; restoring normally.")
+        keep = False
+
+    # Validate that the stash location exists, with one stat reused below
+    try:
+        deep_stat = os.stat(ghost["deep"])
+    except OSError:
+        deep_stat = None
+    if not finishing and deep_stat is None:
         print(f"❌ Cannot restore because the stashed item at '{ghost['deep']}' does not exist.")
         print("ℹ️ You may need to reconnect the external drive or adjust permissions.")
-        return
+        return False
 
-    if ghost["type"] == "dir":
-        # Copy the stashed directory back to the original location, merging if needed
-        safe_copytree(ghost["deep"], ghost["original"])
-        # Remove the stashed directory
-        shutil.rmtree(ghost["deep"], ignore_errors=True)
+    original_parent = os.path.dirname(ghost["original"])
+    # Members materialized earlier and edited since win over their stashed versions
+    aside = [] if finishing else set_aside_materialized(ghost)
+    if finishing:
+        # Everything was back in place before the interruption; only the stash is left to remove
+        if keep:
+            keep_stashed(config, ghost)
+        else:
+            remove_stashed(ghost)
+    elif ghost.get("store") == "cas":
+        print(f"🔄 Restoring from blob store: {ghost['original']}")
+        journal = journal or Journal.start(config, "restore", ghost_key, ghost["original"])
+        if not dedup_restore(ghost, pool, progress, journal, CHECKSUM or config.get("checksum", False)):
+            put_back_materialized(aside)
+            return False
+        # Local edits go back in before anything in the stash is deleted
+        put_back_materialized(aside)
+        sync_to_disk([ghost["original"]], pool)
+        journal.mark_copied(ghost["original"])
+        # Blobs stay behind for other stashes; 'ds --gc' reclaims the unused ones
+        with phase("delete"):
+            os.remove(ghost["deep"])
+    elif ghost["type"] == "dir":
+        os.makedirs(original_parent, exist_ok=True)
+        if (journal is None and not keep and is_plain_stash(ghost) and not os.path.exists(ghost["original"])
+                and same_filesystem(ghost["deep"], original_parent)
+                and rename_item(ghost["deep"], ghost["original"])):
+            print("⚡ Same filesystem — moved back without copying.")
+        else:
+            journal = journal or Journal.start(config, "restore", ghost_key, ghost["original"], keep=keep)
+            # Copy the stashed directory back to the original location, merging if needed
+            # Every file with a checksum is verified on the way back, before the stash can go
+            sidecar = read_manifest(ghost["checksums"]) if ghost.get("checksums") else None
+            if ghost.get("checksums") and sidecar is None:
+                print(f"⚠️ Cannot read the checksums at '{ghost['checksums']}'; restoring without verifying.")
+            checksums = sidecar["files"] if sidecar is not None else None
+            errors = safe_copytree(ghost["deep"], ghost["original"], progress=progress,
+                                   codec=ghost.get("codec"), journal=journal, checksums=checksums, pool=pool)
+            if errors:
+                # Deleting the stash now would lose the files that didn't make it back
+                for src_file, _, error in errors:
+                    if "checksum" in error:
+                        print(f"❌ {src_file}: {error}")
+                print(f"❌ {len(errors)} files could not be restored; keeping the stash and '{ghost_file}'.")
+                print("ℹ️ Run 'ds --resume' to retry just those files, or 'ds --abort' to undo the restore.")
+                put_back_materialized(aside)
+                return False
+            # Local edits go back in before anything in the stash is deleted
+            put_back_materialized(aside)
+            sync_to_disk([ghost["original"]], pool)
+            journal.mark_copied(ghost["original"])
+            if keep:
+                keep_stashed(config, ghost)
+            else:
+                # Remove the stashed directory
+                with phase("delete"):
+                    shutil.rmtree(ghost["deep"], ignore_errors=True)
     else:
-        if os.path.isdir(ghost["deep"]):
+        if stat.S_ISDIR(deep_stat.st_mode):
             print(f"❌ Error: Stashed item at '{ghost['deep']}' is a directory, but marked as type 'file'. Skipping.")
-            return
+            return False
         print(f"🔄 Restoring: {ghost['deep']} → {ghost['original']}")
-        print("📄 Restoring file with progress...")
         # Ensure the destination directory exists
-        os.makedirs(os.path.dirname(ghost["original"]), exist_ok=True)
-        # Copy the file in chunks to show a gradual progress bar
-        total_size = os.path.getsize(ghost["deep"])
-        chunk_size = 1024 * 1024  # 1 MiB per chunk
+        os.makedirs(original_parent, exist_ok=True)
+        if (journal is None and not keep and is_plain_stash(ghost) and not os.path.isdir(ghost["original"])
+                and same_filesystem(ghost["deep"], original_parent)
+                and rename_item(ghost["deep"], ghost["original"])):
+            print("⚡ Same filesystem — moved back without copying.")
+        else:
+            print("📄 Restoring file with progress...")
+            journal = journal or Journal.start(config, "restore", ghost_key, ghost["original"], keep=keep)
+            # Copy the file in chunks to show a gradual progress bar, into a temporary
+            # file beside the original that only takes its place once it checks out
+            total_size = deep_stat.st_size
+            digest = hashlib.sha256() if ghost.get("sha256") else None
+            partial = ghost["original"] + PARTIAL_SUFFIX
+            try:
+                with phase("copy"), progress_bar(progress, total_size, "♻️ Progress") as update:
+                    if ghost.get("codec"):
+                        decompress_file(ghost["deep"], partial, ghost["codec"], update, digest)
+                    elif pool is not None:
+                        pool.call(total_size, copy_file_data, ghost["deep"], partial, update, digest)
+                    else:
+                        copy_file_data(ghost["deep"], partial, update, digest)
+            except OSError as e:
+                if os.path.exists(partial):
+                    os.remove(partial)
+                print(f"❌ Failed to copy '{ghost['deep']}': {e}. Skipping file.")
+                return False
+            if digest is not None and digest.hexdigest() != ghost["sha256"]:
+                # The stash may be the only copy left; never delete it on a mismatch
+                os.remove(partial)
+                journal.finish()
+                print(f"❌ Checksum mismatch: the stashed copy at '{ghost['deep']}' is corrupt. "
+                      f"Keeping the stash and '{ghost_file}'; nothing was restored.")
+                return False
+            os.replace(partial, ghost["original"])
+            sync_to_disk([ghost["original"]])
+            journal.mark_copied(ghost["original"])
+            if keep:
+                shutil.copystat(ghost["deep"], ghost["original"])
+                keep_stashed(config, ghost)
+            else:
+                # Remove the stashed file
+                with phase("delete"):
+                    os.remove(ghost["deep"])
+
+    with phase("ghost"):
+        # Remove the ghost metadata file after restoration
+        os.remove(ghost_file)
+        if not keep:
+            remove_checksums(ghost)
+            catalog_forget(config, ghost["deep"])
+        if journal is not None:
+            journal.finish()
+    count("items_restored")
+    print(f"♻️ Restored: {ghost['original']}" + (" (stashed copy kept)" if keep else ""))
+    return True
+
+def _raise(error):
+    raise error
+
+def copy_stashed_tree(src, dst, pool):
+    """Copy a stashed directory exactly as it is stored, for moving it to another tier.
+
+    Symlinks are recreated as symlinks. Unlike parallel_copytree, nothing is
+    skipped: any entry that can't be copied raises OSError, because the source
+    is deleted once the copy is in place.
+    """
+    tasks = []
+    with phase("mkdir"):
+        for root, dirnames, names in os.walk(src, onerror=_raise):
+            dst_root = os.path.normpath(os.path.join(dst, os.path.relpath(root, src)))
+            os.makedirs(dst_root, exist_ok=True)
+            for name in dirnames + names:
+                path = os.path.join(root, name)
+                if os.path.islink(path):
+                    os.symlink(os.readlink(path), os.path.join(dst_root, name))
+                elif name in names:
+                    tasks.append((os.lstat(path).st_size, copy_file, (path, os.path.join(dst_root, name))))
+    with phase("copy"):
+        for _ in pool.run(tasks):
+            pass
+
+def migrate_item(ghost_file, source, target, size, files, pool):
+    """Move one stashed item from the source tier to the target tier and repoint its ghost.
+
+    The item is copied (or renamed, on the same filesystem) first, then the
+    ghost is replaced atomically, and only then is the old copy deleted, so the
+    ghost always points at a complete copy; the copy and the new ghost are
+    flushed to disk before anything is deleted. size and files come from the
+    source catalog. Returns True if the item moved.
+    """
+    ghost = read_ghost(ghost_file)
+    if ghost is None:
+        print(f"⚠️ Cannot read '{ghost_file}'. Skipping.")
+        return False
+    deep = ghost["deep"]
+    print(f"🚚 Moving {ghost.get('original', ghost_file[:-3])}: {source['name']} → {target['name']}")
+    dest = None
+    renamed = False
+    try:
+        if ghost.get("store") == "cas":
+            manifest = read_manifest(deep)
+            if manifest is None:
+                print(f"❌ Cannot read the manifest at '{deep}'.")
+                return False
+            source_meta, target_meta = meta_path(source), meta_path(target)
+            copied = []
+            for entry in manifest["files"]:
+                blob = blob_path(target_meta, entry["digest"], entry.get("codec"))
+                if not os.path.exists(blob):
+                    os.makedirs(os.path.dirname(blob), exist_ok=True)
+                    tmp = f"{blob}.tmp-{os.getpid()}"
+                    copy_file_data(blob_path(source_meta, entry["digest"], entry.get("codec")), tmp)
+                    os.replace(tmp, blob)
+                    copied.append(blob)
+            os.makedirs(os.path.join(target_meta, "manifests"), exist_ok=True)
+            dest = get_unique_path(os.path.join(target_meta, "manifests", os.path.basename(deep)))
+            write_json_atomic(dest, manifest)
+            synced = [dest] + copied
+        else:
+            dest = get_unique_path(os.path.join(target["root"], os.path.basename(deep)))
+            synced = [dest]
+            if same_filesystem(deep, target["root"]) and rename_item(deep, dest):
+                renamed = True
+            elif os.path.islink(deep):
+                os.symlink(os.readlink(deep), dest)
+            elif os.path.isdir(deep):
+                # Copied byte for byte: compressed files and pack segments stay as they are
+                copy_stashed_tree(deep, dest, pool)
+            else:
+                copy_file(deep, dest)
+        if ghost.get("checksums"):
+            sidecar = read_manifest(ghost["checksums"])
+            if sidecar is not None:
+                os.makedirs(meta_path(target, "checksums"), exist_ok=True)
+                write_json_atomic(checksums_path(target, dest), sidecar)
+                synced.append(checksums_path(target, dest))
+        # A renamed item is the same data on the same disk; everything copied has to be flushed
+        sync_to_disk(synced[1:] if renamed else synced, pool)
+        old = dict(ghost)
+        ghost["deep"] = dest
+        if old.get("checksums"):
+            ghost["checksums"] = checksums_path(target, dest)
+        write_json_atomic(ghost_file, ghost)
+        sync_to_disk([ghost_file])
+    except OSError as e:
+        print(f"❌ Failed to move '{deep}': {e}")
+        if renamed:
+            os.rename(dest, deep)
+        elif dest is not None:
+            remove_stashed({"deep": dest})
+        if dest is not None and ghost.get("checksums"):
+            remove_checksums({"checksums": checksums_path(target, dest)})
+        return False
+
+    catalog_record(target, ghost, os.path.abspath(ghost_file), size, files)
+    catalog_forget(source, deep)
+    # Blobs stay in the old tier for its other stashes; 'ds --gc' reclaims the rest
+    if renamed:
+        remove_checksums(old)
+    else:
+        remove_stashed(old)
+    return True
+
+def migrate_items(config):
+    """Demote cold items to the next tier that takes them.
+
+    An item is cold once it has been stashed longer than its tier's
+    max_age_days; if a tier is over its capacity, its oldest items go too.
+    Returns True if every move succeeded.
+    """
+    tiers = [tier for tier in stash_tiers(config) if os.path.isdir(tier["root"])]
+    if len(tiers) < 2:
+        print("ℹ️ Fewer than two stash tiers are configured and reachable; nothing to migrate.")
+        return True
+    ok = True
+    moved = 0
+    for i, tier in enumerate(tiers[:-1]):
+        with closing(open_catalog(tier)) as conn:
+            catalog_fill_sizes(conn)
+            rows = conn.execute("SELECT deep, original, size, files, timestamp, ghost FROM items"
+                                " WHERE ghost IS NOT NULL AND state IS NULL ORDER BY timestamp").fetchall()
+        cold = []
+        if "max_age_days" in tier:
+            cutoff = datetime.now().timestamp() - float(tier["max_age_days"]) * 86400
+            cold = [row for row in rows if row[4] and datetime.fromisoformat(row[4]).timestamp() < cutoff]
+        if "capacity" in tier:
+            excess = sum(row[2] or 0 for row in rows) - sum(row[2] or 0 for row in cold) - parse_size(tier["capacity"])
+            for row in rows:
+                if excess <= 0:
+                    break
+                if row not in cold:
+                    cold.append(row)
+                    excess -= row[2] or 0
+        for deep, original, size, files, _, ghost_file in cold:
+            journal = find_journal(tier, "restore", ghost_file)
+            if journal is not None:
+                journal.close()
+                continue  # Half restored; 'ds --resume' finishes it where it is
+            lower = pick_tier(tiers[i + 1:], os.path.basename(original or deep), size or 0)
+            if lower is None:
+                print(f"⚠️ No lower tier has room for {original or deep}. Leaving it in '{tier['name']}'.")
+                ok = False
+                continue
+            with CopyPool(lower.get("jobs") or JOBS, SPLIT_LARGE) as pool:
+                if migrate_item(ghost_file, tier, lower, size or 0, files or 0, pool):
+                    moved += 1
+                else:
+                    ok = False
+    print(f"✅ Migrated {moved} items." if moved else "✅ Nothing needed to move.")
+    return ok
+
+def normalize_member(member):
+    """Turn a user-supplied member path like './src/main.c' into the relative form stashes use."""
+    member = member.replace(os.sep, "/").strip("/")
+    while member.startswith("./"):
+        member = member[2:]
+    return os.path.normpath(member).replace(os.sep, "/")
+
+def restore_member(ghost_file, member):
+    """Restore a single member of a stashed directory, leaving the stash in place.
+
+    The member is recorded in the .ds file as materialized, along with its size
+    and mtime, so a later full restore won't overwrite it if it has been edited.
+    """
+    ghost = read_ghost(ghost_file)
+    if ghost is None:
+        print(f"❌ Cannot read '{ghost_file}'.")
+        return False
+    if ghost.get("type") != "dir":
+        print(f"❌ '{ghost_file}' is a stashed file, not a directory; restore it without --only.")
+        return False
+    if not os.path.exists(ghost["deep"]):
+        print(f"❌ Cannot restore because the stashed item at '{ghost['deep']}' does not exist.")
+        return False
+    member = normalize_member(member)
+    if member == ".." or member.startswith("../"):
+        print(f"❌ '{member}' is outside the stashed directory.")
+        return False
+    original = ghost.get("original", ghost_file[:-3])
+    dst_file = os.path.join(original, member)
+    try:
+        if ghost.get("store") == "pack":
+            if _find_pack_member(ghost["deep"], member) is None:
+                print(f"❌ '{member}' is not in the stash.")
+                return False
+            if unpack_tree(ghost["deep"], original, members=[member]):
+                return False
+        elif ghost.get("store") == "cas":
+            manifest = read_manifest(ghost["deep"]) or {"files": []}
+            entry = next((e for e in manifest["files"] if e["path"] == member), None)
+            if entry is None:
+                print(f"❌ '{member}' is not in the stash.")
+                return False
+            os.makedirs(os.path.dirname(dst_file), exist_ok=True)
+            message, _ = _restore_blob(os.path.dirname(os.path.dirname(ghost["deep"])), entry, dst_file)
+            if message:
+                print(message)
+                return False
+        else:
+            src_file = os.path.join(ghost["deep"], member)
+            os.makedirs(os.path.dirname(dst_file), exist_ok=True)
+            if ghost.get("codec") and os.path.isfile(src_file + COMPRESSED_SUFFIX):
+                decompress_file(src_file + COMPRESSED_SUFFIX, dst_file, ghost["codec"])
+                shutil.copystat(src_file + COMPRESSED_SUFFIX, dst_file)
+            elif os.path.isfile(src_file):
+                copy_file(src_file, dst_file)
+            else:
+                print(f"❌ '{member}' is not in the stash.")
+                return False
+        st = os.lstat(dst_file)
+        if stat.S_ISREG(st.st_mode):
+            ghost.setdefault("materialized", {})[member] = [st.st_size, st.st_mtime]
+            write_json_atomic(ghost_file, ghost)
+    except OSError as e:
+        print(f"❌ Failed to restore '{member}': {e}")
+        return False
+    print(f"♻️ Restored member: {dst_file}")
+    return True
+
+class _CodecReader:
+    """A codec's decompressing reader that also closes the stashed file underneath it."""
+
+    def __init__(self, reader, raw):
+        self._reader = reader
+        self._raw = raw
+
+    def __getattr__(self, name):
+        return getattr(self._reader, name)
+
+    def __iter__(self):
+        return iter(self._reader)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def close(self):
         try:
-            with open(ghost["deep"], "rb") as fsrc, open(ghost["original"], "wb") as fdst:
-                with tqdm(total=total_size, unit="B", unit_scale=True, desc="♻️ Progress") as pbar:
-                    while True:
-                        try:
-                            chunk = fsrc.read(chunk_size)
-                        except OSError as e:
-                            print(f"❌ Failed to read from '{ghost['deep']}': {e}. Skipping file.")
-                            return
-                        if not chunk:
-                            break
-                        fdst.write(chunk)
-                        pbar.update(len(chunk))
-        except OSError as e:
-            print(f"❌ Cannot open one of the files for copying: {e}. Skipping.")
-            return
-        # Remove the stashed file
-        os.remove(ghost["deep"])
+            self._reader.close()
+        finally:
+            self._raw.close()
+
+def _open_plain(path, use_mmap=False):
+    """Open a file stored as-is, as a file object or a read-only memory map."""
+    if not use_mmap:
+        return open(path, "rb")
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def _find_pack_member(path, member):
+    """Return (segment path, ZipInfo) for a file in a packed stash, or None."""
+    for segment in read_pack_index(path)["segments"]:
+        segment_path = os.path.join(path, segment)
+        with zipfile.ZipFile(segment_path) as zf:
+            try:
+                return segment_path, zf.getinfo(member)
+            except KeyError:
+                pass
+    return None
+
+def open_stashed(ghost_file, member=None, use_mmap=False, materialize=False):
+    """Open a stashed file for reading straight from the stash, without restoring it.
+
+    member names a file inside a stashed directory. Compressed files are
+    decompressed as they are read, packed members are read through the
+    segment's zip index, and deduplicated files come from their blob.
+    use_mmap returns a read-only memory map instead of a file object; that
+    needs the file to be stored uncompressed and unpacked.
+    With materialize, the member is first restored to its original location
+    (once; later calls reuse it) and recorded in the .ds file, and the local
+    copy is opened.
+    Raises OSError if the stash or member can't be found, ValueError for
+    requests the stash can't serve.
+    """
+    ghost = read_ghost(ghost_file)
+    if ghost is None:
+        raise FileNotFoundError(errno.ENOENT, "Cannot read the .ds file", ghost_file)
+    if member is not None:
+        member = normalize_member(member)
+        if member == ".":
+            member = None
+        elif member == ".." or member.startswith("../"):
+            raise ValueError(f"'{member}' is outside the stashed directory")
+    if ghost.get("type") == "dir" and member is None:
+        raise IsADirectoryError(errno.EISDIR, "Name a member of the stashed directory", ghost_file)
+    if ghost.get("type") != "dir" and member is not None:
+        raise NotADirectoryError(errno.ENOTDIR, "The stashed item is a file, not a directory", ghost_file)
+
+    if materialize and member is not None:
+        local = os.path.join(ghost["original"], member)
+        if member not in ghost.get("materialized", {}) or not os.path.isfile(local):
+            if not restore_member(ghost_file, member):
+                raise FileNotFoundError(errno.ENOENT, "Could not materialize the member", member)
+        return _open_plain(local, use_mmap)
+
+    store = ghost.get("store")
+    if store == "pack":
+        found = _find_pack_member(ghost["deep"], member)
+        if found is None or found[1].is_dir():
+            raise FileNotFoundError(errno.ENOENT, "Not a file in the stash", member)
+        if use_mmap:
+            raise ValueError("packed stashes can't be memory-mapped; open the member as a file instead")
+        zf = zipfile.ZipFile(found[0])
+        try:
+            # The member keeps the segment open until it is closed itself
+            return zf.open(found[1])
+        finally:
+            zf.close()
+    if store == "cas":
+        manifest = read_manifest(ghost["deep"])
+        if manifest is None:
+            raise FileNotFoundError(errno.ENOENT, "Cannot read the manifest", ghost["deep"])
+        entry = next((e for e in manifest["files"] if e["path"] == (member or ".")), None)
+        if entry is None:
+            raise FileNotFoundError(errno.ENOENT, "Not a file in the stash", member)
+        codec = entry.get("codec")
+        path = blob_path(os.path.dirname(os.path.dirname(ghost["deep"])), entry["digest"], codec)
+    else:
+        codec = ghost.get("codec")
+        path = ghost["deep"] if member is None else os.path.join(ghost["deep"], member)
+        if codec and member is not None:
+            # Only compressible members were stored compressed
+            if os.path.isfile(path + COMPRESSED_SUFFIX):
+                path += COMPRESSED_SUFFIX
+            else:
+                codec = None
+        if not os.path.isfile(path):
+            raise FileNotFoundError(errno.ENOENT, "Not a file in the stash", path)
+    if not codec:
+        return _open_plain(path, use_mmap)
+    if use_mmap:
+        raise ValueError("compressed stashes can't be memory-mapped; open the file instead")
+    if get_codec(codec) is None:
+        raise ValueError(f"{codec} compression is not available here")
+    raw = open(path, "rb")
+    return _CodecReader(get_codec(codec)[1](raw), raw)
+
+def read_target_list(path):
+    """Read NUL-delimited targets (as written by 'find -print0') from a file, or stdin for '-'.
 
-    # Remove the ghost metadata file after restoration
-    os.remove(ghost_file)
-    print(f"♻️ Restored: {ghost['original']}")
+    Falls back to one target per line if the input contains no NUL bytes.
+    """
+    if path == "-":
+        data = sys.stdin.buffer.read()
+    else:
+        with open(path, "rb") as f:
+            data = f.read()
+    sep = b"\0" if b"\0" in data else b"\n"
+    return [os.fsdecode(item) for item in data.split(sep) if item.strip()]
+
+def plan_batch(targets, restoring):
+    """Size up every target before anything moves.
+
+    Returns (planned, skipped): a list of (target, bytes) and a list of (target, reason).
+    """
+    planned = []
+    skipped = []
+    for target in targets:
+        if restoring:
+            ghost = read_ghost(target)
+            if ghost is None:
+                skipped.append((target, "unreadable or missing .ds file"))
+                continue
+            item = ghost["deep"]
+        else:
+            item = target
+        if not os.path.exists(item):
+            skipped.append((target, f"'{item}' does not exist"))
+            continue
+        try:
+            planned.append((target, stashed_size(ghost) if restoring else item_size(item)[0]))
+        except (OSError, ValueError, KeyError) as e:
+            skipped.append((target, str(e)))
+    return planned, skipped
+
+def run_batch(targets, config, restoring, skipped=()):
+    """Stash or restore many targets through one shared copy pool and one progress bar.
+
+    Returns True if nothing failed.
+    """
+    planned, skipped_now = plan_batch(targets, restoring)
+    skipped = list(skipped) + skipped_now
+    # Each tier gets its own copy pool and item workers, so a slow tier can't hold up a fast one
+    groups = {}
+    pending = {}
+    for target, size in planned:
+        if restoring:
+            tier = tier_for_path(config, read_ghost(target)["deep"])
+        else:
+            tier = place_item(target, config, size, pending)
+            if tier is None:
+                skipped.append((target, "no stash tier accepts it or has room for it"))
+                continue
+            pending[tier["root"]] = pending.get(tier["root"], 0) + size
+        groups.setdefault(tier["root"], (tier, []))[1].append((target, size))
+    total = sum(size for _, items in groups.values() for _, size in items)
+    action = "restore" if restoring else "stash"
+    across = f" across {len(groups)} tiers" if len(groups) > 1 else ""
+    print(f"🗂️ Batch: {sum(len(items) for _, items in groups.values())} items, {format_size(total)} to {action}{across}.")
+
+    succeeded = []
+    failed = []
+    lock = threading.Lock()
+    with ExitStack() as stack:
+        pbar = stack.enter_context(tqdm(total=total, unit="B", unit_scale=True, desc="🗂️ Batch"))
+
+        def run_one(target, planned_size, tier, pool):
+            done = [0]
+
+            def advance(n):
+                with lock:
+                    done[0] += n
+                    pbar.update(n)
+
+            if restoring:
+                ok = restore(target, tier, pool, advance)
+            else:
+                ok = deepstash_item(target, tier, pool, advance)
+            # Account for bytes that moved without a copy (renames) or were skipped
+            advance(max(0, planned_size - done[0]))
+            return ok
+
+        # Item threads only orchestrate; the copying itself happens on the tier's shared pool
+        futures = {}
+        for tier, items in groups.values():
+            pool = stack.enter_context(CopyPool(tier.get("jobs") or JOBS, SPLIT_LARGE))
+            workers = stack.enter_context(ThreadPoolExecutor(max_workers=pool.jobs))
+            for target, size in items:
+                futures[workers.submit(run_one, target, size, tier, pool)] = target
+        for future in as_completed(futures):
+            try:
+                ok = future.result()
+            except Exception as e:
+                print(f"❌ {futures[future]}: {e}")
+                ok = False
+            (succeeded if ok else failed).append(futures[future])
+
+    print(f"\n📋 Batch summary: {len(succeeded)} succeeded, {len(skipped)} skipped, {len(failed)} failed.")
+    for target, reason in skipped:
+        print(f"  ⏭️ {target}: {reason}")
+    for target in failed:
+        print(f"  ❌ {target}")
+    return not failed
+
+def write_metrics(metrics, stats=False, path=None):
+    """Report a run's metrics on exit: a summary on stderr with --stats, JSON to a file ('-' for stderr) with --metrics-json."""
+    if stats:
+        metrics.report()
+    if not path:
+        return
+    data = metrics.as_dict()
+    data["command"] = sys.argv[1:]
+    if path == "-":
+        json.dump(data, sys.stderr, indent=2)
+        print(file=sys.stderr)
+    else:
+        with open(path, "w") as f:
+            json.dump(data, f, indent=2)
+
+def pop_option(args, name, default=None):
+    """Remove an option that takes a value ('--name VALUE' or '--name=VALUE') from args and return the value."""
+    for i, arg in enumerate(args):
+        if arg == name:
+            if i + 1 >= len(args):
+                print(f"❌ {name} expects a value.")
+                sys.exit(1)
+            value = args[i + 1]
+            del args[i:i + 2]
+            return value
+        if arg.startswith(name + "="):
+            del args[i]
+            return arg[len(name) + 1:]
+    return default
 
 def main():
     """Parse command-line arguments and execute the appropriate DeepStash action."""
-    global VERBOSE
+    global VERBOSE, JOBS, SPLIT_LARGE, DEDUP, COMPRESS, PACK, KEEP, CHECKSUM, METRICS
     args = sys.argv[1:]
 
     if "--verbose" in args:
         VERBOSE = True
         args.remove("--verbose")
 
+    jobs = pop_option(args, "--jobs")
+    if jobs is not None and jobs != "auto":
+        if not jobs.isdigit() or int(jobs) < 1:
+            print("❌ --jobs expects a positive number or 'auto'.")
+            sys.exit(1)
+        JOBS = int(jobs)
+
+    if "--split-large" in args:
+        SPLIT_LARGE = True
+        args.remove("--split-large")
+
+    if "--dedup" in args:
+        DEDUP = True
+        args.remove("--dedup")
+
+    COMPRESS = pop_option(args, "--compress")
+    if COMPRESS is not None and get_codec(COMPRESS) is None:
+        print(f"❌ Unknown or unavailable codec '{COMPRESS}'. Choose from: {', '.join(available_codecs())}.")
+        if COMPRESS == "zstd":
+            print("ℹ️ zstd needs Python 3.14+ or the 'zstandard' package (pip install zstandard).")
+        sys.exit(1)
+
+    if "--pack" in args:
+        PACK = True
+        args.remove("--pack")
+
+    if "--keep" in args:
+        KEEP = True
+        args.remove("--keep")
+
+    if "--checksum" in args:
+        CHECKSUM = True
+        args.remove("--checksum")
+
+    stats = "--stats" in args
+    if stats:
+        args.remove("--stats")
+    metrics_json = pop_option(args, "--metrics-json")
+    if stats or metrics_json:
+        METRICS = Metrics()
+        atexit.register(write_metrics, METRICS, stats, metrics_json)
+
+    rate = pop_option(args, "--rate")
+    if rate is not None:
+        try:
+            rate = float(rate)
+            if rate <= 0:
+                raise ValueError
+        except ValueError:
+            print("❌ --rate expects a positive number of MB/s.")
+            sys.exit(1)
+
+    only = []
+    member = pop_option(args, "--only")
+    while member is not None:
+        only.append(member)
+        member = pop_option(args, "--only")
+
+    from_file = pop_option(args, "--from-file")
+
     # Display help information if requested
     if args and args[0] in ("--help", "-h"):
         print("""📘 DeepStash Command Help:
@@ -287,6 +3021,52 @@ def main():
     Restore the specified item using its .ds metadata file.
     Use exclusion patterns to skip certain restores, e.g., !.log to avoid restoring .log files.
 
+  ds --list
+    List everything in the stash, straight from the stash catalog.
+
+  ds --find <glob>
+    List stashed items whose original or stash path matches the glob, e.g. '*.iso'.
+
+  ds --du
+    Show how much space the stash uses, and its largest items.
+
+  ds --reindex [<dir> ...]
+    Rebuild the catalog from the stash contents and the .ds files found under the
+    given directories (default: your home directory).
+
+  ds --scan [<dir> ...] [--json]
+    Find every .ds file under the given directories (default: your home directory)
+    and check it against the stash: ghosts whose stashed item is missing or has the
+    wrong type, unreadable ghosts, and stashed items no ghost points to. --json
+    prints the report as JSON for monitoring; the exit status is 1 if anything is wrong.
+
+  ds --verify [<file_or_folder>.ds ...] [--rate MB/s]
+    Check stashed items (default: everything in the catalog) against the checksums
+    taken when they were stashed, hashing in parallel. --rate caps the combined read
+    speed so it can run nightly without hogging the drive.
+
+  ds --gc
+    Delete blobs in the deduplicating store that no stashed item uses any more.
+
+  ds --resume
+    Finish stashes and restores that were interrupted (crash, unplugged drive, Ctrl-C),
+    copying only the files that hadn't been copied yet.
+
+  ds --abort
+    Roll back interrupted stashes and restores instead: a partial stash copy is
+    deleted (the original was never touched), as are the files a partial restore put back.
+
+  ds --open <file_or_folder>.ds [member] [--materialize]
+    Write a stashed file, or one member of a stashed folder, to stdout straight
+    from the stash without restoring anything, e.g. ds --open data.ds conf/app.yaml | less.
+    With --materialize, the member is restored to its original place first (and
+    noted in the .ds file, so a later full restore keeps your edits to it).
+
+  ds --migrate
+    With tiered stash roots, move items that have been stashed longer than their
+    tier's max_age_days, or that push it over its capacity, down to the next tier
+    that takes them. Each .ds file is repointed atomically once its item has moved.
+
   ds --help or ds -h
     Show this usage information.
 
@@ -297,11 +3077,70 @@ Examples:
   ds mynotes.txt.ds
   ds photos/ '!.raw' '!.tmp'
   ds backup.db.ds '!.bak'
+  find . -name '*.ds' -print0 | ds --from-file -
 
 Advanced Options:
   --verbose
     Show detailed messages for each skipped file.
 
+  --jobs N
+    Number of files to copy at once when stashing a folder (default: auto).
+
+  --split-large
+    Copy large files on their own workers so they don't hold up small ones.
+
+  --dedup
+    Store file contents once in a content-addressed blob store, so stashing the
+    same files again costs almost nothing. Set "dedup": true in ~/.dsconfig.json
+    to make it the default.
+
+  --compress zstd|lzma|gzip
+    Compress stashed files while they are copied (zstd needs Python 3.14+ or the
+    'zstandard' package). Files that are compressed already, like .jpg or .zip,
+    are stored as-is. Restoring decompresses automatically. Set "compress" in
+    ~/.dsconfig.json to make it the default.
+
+  --pack
+    Stash folders as a few sequential zip archive segments instead of one file per
+    file, which is much faster on HDD and network stash targets with many small files.
+    Set "pack": true in ~/.dsconfig.json to make it the default.
+
+  --checksum
+    Take a SHA-256 of every file while it is copied into the stash (no extra read
+    pass) and store it with the .ds file, or in a sidecar for folders. Restores then
+    check each file on the way back and keep the stash if anything doesn't match.
+    Set "checksum": true in ~/.dsconfig.json to make it the default.
+
+  --keep
+    When restoring, leave the stashed copy in place. Stashing the same path again
+    then only copies the files that changed, were added or were deleted.
+
+  --stats
+    When the command finishes, print how long each phase took (walk, mkdir, copy,
+    sync, delete, ghost, rename) and how many files and bytes were copied, plus peak memory.
+
+  --metrics-json <path>
+    Write the same metrics as JSON to a file ('-' for stderr), e.g. for dashboards.
+
+  --only <path>
+    With a .ds file of a stashed folder, restore just that member (repeatable),
+    e.g. ds proj.ds --only src/main.c. The stash and the .ds file stay in place.
+
+  --from-file <path>
+    Read more targets from a file, or from stdin with '-'. Entries are NUL-delimited
+    (as from 'find -print0'), or one per line if there are no NUL bytes.
+    Several targets are planned up front and run together through one shared
+    copy pool with a single progress bar, followed by a summary.
+
+Tiered Stash Roots:
+  Instead of "root", ~/.dsconfig.json can list several "tiers", fastest first:
+    {"tiers": [{"name": "ssd", "root": "/mnt/ssd/stash", "capacity": "200G",
+                "max_size": "10G", "max_age_days": 30, "jobs": 16},
+               {"name": "archive", "root": "/mnt/hdd/stash", "jobs": 2, "pack": true}]}
+  New stashes go to the first tier whose rules accept them (min_size, max_size,
+  patterns such as ["*.iso"]) and that has room under its capacity. Each tier
+  copies with its own number of jobs and can override settings like compress or pack.
+
 Automatic Skipping:
   If too many files in a directory fail to copy, DeepStash will automatically skip the rest of that directory.
   If all files in a directory are unreadable `.ds` files, that directory will be skipped without prompt.
@@ -309,13 +3148,13 @@ Automatic Skipping:
         return
 
     # Show usage info if no arguments provided
-    if not args:
+    if not args and from_file is None:
         print("ℹ️ Usage: ds --init | ds <file_or_folder> | ds <file_or_folder>.ds")
         print("Use --help for more information.")
         return
 
     # Initialize stash root directory
-    if args[0] == "--init":
+    if args and args[0] == "--init":
         init()
         return
 
@@ -325,18 +3164,112 @@ Automatic Skipping:
     # Handle exclusion patterns like !.png, !.jpg, etc.
     exclude_patterns = [arg[1:] for arg in args if arg.startswith("!")]
     args = [arg for arg in args if not arg.startswith("!")]
+    if from_file is not None:
+        args += read_target_list(from_file)
+    excluded = []
     if exclude_patterns:
-        args = [t for t in args if not any(t.endswith(p) for p in exclude_patterns)]
-
-    if all(t.endswith(".ds") for t in args):
-        for t in args:
-            restore(t)
-    elif all(not t.endswith(".ds") for t in args):
-        for t in args:
-            deepstash_item(t, config)
-    else:
+        excluded = [t for t in args if any(t.endswith(p) for p in exclude_patterns)]
+        args = [t for t in args if t not in excluded]
+
+    if not args:
+        print("ℹ️ Nothing to do.")
+        return
+
+    # Catalog queries answered from the index in each stash root
+    if args[0] == "--list":
+        for tier in each_tier(config):
+            list_catalog(tier)
+        return
+    if args[0] == "--find":
+        if len(args) < 2:
+            print("❌ Usage: ds --find <glob>")
+            sys.exit(1)
+        for tier in each_tier(config):
+            list_catalog(tier, args[1])
+        return
+    if args[0] == "--du":
+        for tier in each_tier(config):
+            catalog_usage(tier)
+        return
+    if args[0] == "--reindex":
+        roots = [tier["root"] for tier in stash_tiers(config)]
+        for tier in each_tier(config):
+            reindex_catalog(tier, args[1:] or [os.path.expanduser("~")], skip=roots)
+        return
+    if args[0] == "--gc":
+        for tier in each_tier(config):
+            collect_garbage(tier)
+        return
+    if args[0] == "--resume":
+        ok = True
+        for tier in each_tier(config):
+            ok = resume_journals(tier) and ok
+        if not ok:
+            sys.exit(1)
+        return
+    if args[0] == "--abort":
+        for tier in each_tier(config):
+            abort_journals(tier)
+        return
+    if args[0] == "--migrate":
+        if not migrate_items(config):
+            sys.exit(1)
+        return
+    if args[0] == "--verify":
+        if not verify_stashes(config, args[1:], rate):
+            sys.exit(1)
+        return
+    if args[0] == "--scan":
+        as_json = "--json" in args
+        search_dirs = [arg for arg in args[1:] if arg != "--json"] or [os.path.expanduser("~")]
+        if not scan_ghosts(config, search_dirs, as_json):
+            sys.exit(1)
+        return
+    if args[0] == "--open":
+        materialize = "--materialize" in args
+        args = [arg for arg in args if arg != "--materialize"]
+        if len(args) not in (2, 3):
+            print("❌ Usage: ds --open <file>.ds [member] [--materialize]", file=sys.stderr)
+            sys.exit(1)
+        try:
+            # stdout carries the file's contents, so any messages go to stderr
+            with redirect_stdout(sys.stderr):
+                stashed = open_stashed(args[1], args[2] if len(args) == 3 else None, materialize=materialize)
+            with stashed:
+                shutil.copyfileobj(stashed, sys.stdout.buffer, CHUNK_SIZE)
+            sys.stdout.buffer.flush()
+        except BrokenPipeError:
+            # The reader went away (e.g. piped into 'head'); that's not an error
+            devnull = os.open(os.devnull, os.O_WRONLY)
+            os.dup2(devnull, sys.stdout.fileno())
+        except (OSError, ValueError) as e:
+            print(f"❌ Cannot open '{args[1]}': {e}", file=sys.stderr)
+            sys.exit(1)
+        return
+
+    restoring = all(t.endswith(".ds") for t in args)
+    if not restoring and any(t.endswith(".ds") for t in args):
         print("❌ Mixed operation detected. Please run restore and stash operations separately.")
         sys.exit(1)
 
+    # Pull individual members out of stashed directories, leaving the stash in place
+    if only:
+        if not restoring:
+            print("❌ --only works with .ds files, e.g. ds proj.ds --only src/main.c")
+            sys.exit(1)
+        results = [restore_member(t, m) for t in args for m in only]
+        if not all(results):
+            sys.exit(1)
+        return
+
+    # Several targets share one scheduler and progress bar instead of running one by one
+    if len(args) > 1 or from_file is not None:
+        if not run_batch(args, config, restoring, [(t, "excluded") for t in excluded]):
+            sys.exit(1)
+    elif restoring:
+        restore(args[0], config)
+    else:
+        deepstash_item(args[0], config)
+
 if __name__ == "__main__":
     main()
@@ -30,5 +30,5 @@ setup(
         "Environment :: Console",
         "Topic :: Utilities",
     ],
-    python_requires='>=3.6',
+    python_requires='>=3.8',
 )